@@ -18,6 +18,7 @@ setuptools.setup(
             "data/pileup/*.root",
             "data/MuonScale/*txt",
             "data/goldenJsons/*.txt",
+            "data/goldenJsons/*.json",
             "data/TauSF/*.json",
             "data/topmva/lepid_weights/*.bin",
             "data/btag_sf_correctionlib/*json",
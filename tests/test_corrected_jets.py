@@ -0,0 +1,201 @@
+import json
+import warnings
+
+import pytest
+import numpy as np
+import awkward as ak
+
+from topcoffea.modules.CorrectedJetsFactory import CorrectedJetsFactory, get_corr_inputs, jer_smear_variations, _JERSF_FORM
+from topcoffea.modules.counter_rng import counter_rand_uniform, STREAM_MUONS, _philox4x32
+from topcoffea.modules.CorrectedMETFactory import corrected_polar_met, segmented_sum
+from topcoffea.modules.synthetic_jets import (
+    jer_tag, junc_types, name_map, make_jets, make_met, make_jecstack_evaluator, make_jecstack, make_clib_stack, build, build_with_met,
+)
+
+
+def flat(arr):
+    return ak.to_numpy(ak.flatten(arr)).astype(np.float64)
+
+
+def test_clib_jec_levels():
+    levels = ["L1FastJet", "L2Relative", "L3Absolute", "L2L3Residual"]
+    stack = make_clib_stack(levels, savecorr=True)
+    jets = make_jets()
+    out = build(stack, jets)
+
+    # Reference: evaluate the levels one by one, each on the pt corrected by all of the previous ones
+    columns = {field: ak.flatten(jets[field]) for field in ak.fields(jets)}
+    jec_name_map = dict(name_map, JetPt="pt_raw", JetMass="mass_raw")
+    total = None
+    for clib_name in stack.jec_names_clib:
+        sf = stack.corrections[clib_name]
+        inputs = get_corr_inputs(columns, sf, jec_name_map, cache={}, corrections=total, column_cache={})
+        correction = sf.evaluate(*inputs).astype(np.float32)
+        assert np.array_equal(flat(out[f"jet_energy_correction_{clib_name}"]), correction)
+        total = correction if total is None else total * correction
+
+    assert np.array_equal(flat(out.jet_energy_correction), total)
+    assert np.array_equal(ak.to_numpy(ak.flatten(out.pt_jec)), ak.to_numpy(ak.flatten(jets.pt_raw)) * total)
+
+
+def test_clib_vs_jecstack():
+    jets = make_jets(seed=2)
+    jecstack_out = build(make_jecstack(make_jecstack_evaluator()), jets)
+    clib_out = build(make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types), jets)
+
+    assert np.allclose(flat(clib_out.pt), flat(jecstack_out.pt), rtol=1e-5)
+    assert np.allclose(flat(clib_out.pt_jec), flat(jecstack_out.pt_jec), rtol=1e-5)
+    assert np.array_equal(flat(clib_out.jet_energy_resolution_scale_factor), flat(jecstack_out.jet_energy_resolution_scale_factor))
+    jersf_form = json.loads(ak.flatten(clib_out.jet_energy_resolution_scale_factor).layout.form.tojson())
+    assert {k: jersf_form[k] for k in _JERSF_FORM} == _JERSF_FORM
+    for var in ["JER", "JES_FlavorQCD"]:
+        for updown in ["up", "down"]:
+            assert np.allclose(flat(clib_out[var][updown].pt), flat(jecstack_out[var][updown].pt), rtol=1e-5)
+            assert np.allclose(flat(clib_out[var][updown].mass), flat(jecstack_out[var][updown].mass), rtol=1e-5)
+
+
+def test_systematics_subset():
+    jets = make_jets(200, seed=3)
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types)
+    full = build(stack, jets)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        factory = CorrectedJetsFactory(dict(name_map), stack)
+    nominal = factory.build(jets, {}, systematics=[])
+    assert not any(f.startswith(("JER", "JES", "jet_energy_uncertainty")) for f in ak.fields(nominal))
+    assert np.array_equal(flat(nominal.pt), flat(full.pt))
+
+    subset = factory.build(jets, {}, systematics=["JES_FlavorQCD"])
+    assert [f for f in ak.fields(subset) if f.startswith(("JER", "JES"))] == ["JES_FlavorQCD"]
+    for updown in ["up", "down"]:
+        assert np.array_equal(flat(subset.JES_FlavorQCD[updown].pt), flat(full.JES_FlavorQCD[updown].pt))
+
+    with pytest.raises(ValueError, match="Unknown systematics"):
+        factory.build(jets, {}, systematics=["JES_Nonexistent"])
+
+
+def test_hybrid_jer_smearing():
+    jets = make_jets(500, seed=5)
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag)
+    corrected_jets = build(stack, jets)
+
+    # The gen matched jets are smeared with the scaling method, which does not depend on the random numbers
+    pt_jec = flat(corrected_jets.pt_jec)
+    pt_gen = flat(jets.pt_gen)
+    hybrid = pt_gen > 0
+    jersf = ak.to_numpy(ak.flatten(corrected_jets.jet_energy_resolution_scale_factor))[:, 0]
+    expected = 1 + (jersf - 1) * (pt_jec - pt_gen) / pt_jec
+    assert np.allclose(flat(corrected_jets.jet_energy_resolution_correction)[hybrid], expected[hybrid], rtol=1e-5)
+
+
+def test_philox():
+    # Known answer vectors of the Random123 Philox4x32-10
+    def philox(*words):
+        return [int(x) for x in _philox4x32(*(np.uint64(w) for w in words))]
+    assert philox(0, 0, 0, 0, 0, 0) == [0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8]
+    assert philox(*[0xffffffff] * 6) == [0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd]
+    assert philox(0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344, 0xa4093822, 0x299f31d0) == [0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1]
+
+
+def test_counter_rng_chunking():
+    jets = make_jets(2000, seed=6)
+    nevents = len(jets)
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        factory = CorrectedJetsFactory(dict(name_map), stack)
+    assert factory.counter_rng
+    no_event_map = {key: value for key, value in name_map.items() if key != "Event"}
+    with pytest.warns(UserWarning, match="JER smearing random numbers"):
+        assert not CorrectedJetsFactory(no_event_map, stack).counter_rng
+
+    full = flat(factory.build(jets, {}).jet_resolution_rand_gauss)
+    chunks = np.concatenate([flat(factory.build(jets[start:start + 300], {}).jet_resolution_rand_gauss) for start in range(0, nevents, 300)])
+    assert np.array_equal(full, chunks)
+    assert abs(np.mean(full)) < 0.05
+    assert abs(np.std(full) - 1) < 0.05
+
+    # Uniform numbers of another stream (e.g. for the muons) are independent of the jet ones
+    event_ids = [ak.flatten(jets[field]) for field in ["run", "lumi", "event"]]
+    uniform = counter_rand_uniform(*event_ids, jets, stream=STREAM_MUONS)
+    assert np.all((uniform >= 0) & (uniform < 1))
+    assert abs(np.mean(uniform) - 0.5) < 0.02
+    assert abs(np.corrcoef(uniform, full)[0, 1]) < 0.05
+
+
+def test_jer_smear_variations():
+    rng = np.random.default_rng(7)
+    n = 100000
+    pt = rng.uniform(0.01, 300, n).astype(np.float32)
+    pt_gen = np.where(rng.uniform(size=n) < 0.7, pt * rng.uniform(0.7, 1.3, n), 0).astype(np.float32)
+    eta = rng.uniform(-5, 5, n).astype(np.float32)
+    jer = rng.uniform(0.02, 0.3, n).astype(np.float32)
+    rand = (3 * rng.normal(size=n)).astype(np.float32)
+    jersf = np.stack([rng.uniform(0.8, 1.3, n), rng.uniform(0.8, 1.4, n), rng.uniform(0.7, 1.2, n)], axis=1).astype(np.float32)
+
+    for force_stochastic in [False, True]:
+        gen = np.zeros_like(pt) if force_stochastic else pt_gen
+        factors = jer_smear_variations(force_stochastic, *(ak.Array(x) for x in (pt_gen, pt, eta, jer, rand, jersf)))
+        assert factors.shape == (3, n) and factors.dtype == np.float32
+        for variation in range(3):
+            sf = jersf[:, variation]
+            delta = (pt - gen) / pt
+            expected = np.where(
+                (gen > 0) & (np.abs(delta) < 3 * jer),
+                1 + (sf - 1) * delta,
+                1 + np.sqrt(np.maximum(sf * sf - 1, 0)) * jer * rand,
+            )
+            min_pt = np.float32(1e-2) / np.cosh(eta)
+            expected = np.where(expected * pt < min_pt, min_pt / pt, expected)
+            assert np.allclose(factors[variation], expected, rtol=1e-5, atol=1e-6)
+
+
+def test_segmented_sum():
+    values = np.arange(12, dtype=np.float32).reshape(2, 6)
+    counts = np.array([0, 2, 0, 3, 1, 0])
+    assert np.array_equal(segmented_sum(values, counts), [[0, 1, 0, 9, 5, 0], [0, 13, 0, 27, 11, 0]])
+    assert np.array_equal(segmented_sum(np.zeros((2, 0)), np.zeros(3, dtype=int)), np.zeros((2, 3)))
+
+
+def test_met_variations():
+    jets = make_jets(2000, seed=8)
+    met = make_met(len(jets))
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types)
+    corrected_jets, corrected_met = build_with_met(stack, jets, met)
+
+    variations = {"nominal": corrected_met}
+    for unc in ["MET_UnclusteredEnergy", "JER", "JES_FlavorQCD", "JES_Absolute"]:
+        for updown in ["up", "down"]:
+            variations[f"{unc}_{updown}"] = corrected_met[unc][updown]
+    batched = {name: (ak.to_numpy(var.pt), ak.to_numpy(var.phi)) for name, var in variations.items()}
+
+    # Reference: one MET computation per variation
+    reference = {}
+    for name in variations:
+        unc, _, updown = name.rpartition("_")
+        variant = corrected_jets if unc in ["", "MET_UnclusteredEnergy"] else corrected_jets[unc][updown]
+        deltas = (updown == "up", met.dx, met.dy) if unc == "MET_UnclusteredEnergy" else None
+        ref = corrected_polar_met(met.pt, met.phi, variant.pt, variant.phi, variant.pt_raw, deltas)
+        reference[name] = (ak.to_numpy(ref.pt), ak.to_numpy(ref.phi))
+
+    for name, (pt, phi) in batched.items():
+        assert pt.dtype == np.float32 and phi.dtype == np.float32
+        assert np.allclose(pt, reference[name][0], rtol=1e-4, atol=1e-3)
+        assert np.allclose(phi, reference[name][1], rtol=1e-4, atol=1e-4)
+
+
+def test_met_variation_laziness():
+    jets = make_jets(200, seed=9)
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types)
+    corrected_jets, corrected_met = build_with_met(stack, jets, make_met(len(jets)))
+
+    def is_built(name):
+        return corrected_jets.layout.content.field(name).peek_array is not None
+
+    ak.to_numpy(corrected_met.pt)
+    ak.to_numpy(corrected_met.MET_UnclusteredEnergy.up.pt)
+    assert not any(is_built(name) for name in ["JER", "JES_FlavorQCD", "JES_Absolute"])
+    # Only the jet variation of the MET systematic that is accessed is built
+    ak.to_numpy(corrected_met.JES_FlavorQCD.down.phi)
+    assert [is_built(name) for name in ["JER", "JES_FlavorQCD", "JES_Absolute"]] == [False, True, False]
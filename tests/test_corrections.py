@@ -0,0 +1,225 @@
+import os
+import shutil
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.correction_cache import CorrectionSetCache
+
+
+def test_correction_set_cache(tmp_path):
+    src = topcoffea_path("data/POG/LUM/2018_UL/puWeights.json.gz")
+    fname = str(tmp_path / "puWeights.json.gz")
+    shutil.copy(src, fname)
+
+    cache = CorrectionSetCache(maxsize=2)
+    cset = cache.get(fname)
+    assert "Collisions18_UltraLegacy_goldenJSON" in list(cset.keys())
+    assert cache.get(fname) is cset
+    assert len(cache) == 1
+
+    # A modified file is parsed again, and replaces the old entry
+    st = os.stat(fname)
+    os.utime(fname, (st.st_atime, st.st_mtime + 10))
+    assert cache.get(fname) is not cset
+    assert len(cache) == 1
+
+    # Least recently used entries are evicted
+    for i in range(3):
+        other = str(tmp_path / f"copy_{i}.json.gz")
+        shutil.copy(src, other)
+        cache.get(other)
+    assert len(cache) == 2
+
+
+def test_lazy_pufunc(tmp_path, monkeypatch):
+    import numpy as np
+    import uproot
+    import topcoffea.modules.corrections as corrections
+
+    # All of the years are listed, but nothing should have been read at import time
+    assert "2018" not in corrections.PUfunc._tables
+    assert set(corrections.PUfunc) == set(corrections.MCPUfile)
+    assert "2018" in corrections.PUfunc and 2018 in corrections.PUfunc
+    assert "2015" not in corrections.PUfunc
+    assert "2018" not in corrections.PUfunc._tables
+
+    with uproot.open(corrections.pudirpath + corrections.GetMCPUname("2018")) as f:
+        h = f["pileup"]
+        expected = h.values() / np.sum(h.values())
+        centers = h.axis(0).centers()
+    assert np.allclose(corrections.PUfunc["2018"]["MC"](centers), expected)
+    assert corrections.PUfunc[2018] is corrections.PUfunc["2018"]
+    assert corrections.PUfunc.get("2018") is corrections.PUfunc["2018"]
+    assert corrections.PUfunc.get("2015") is None
+    assert dict(corrections.PUfunc.items())["2018"] is corrections.PUfunc["2018"]
+
+    # With the on-disk cache enabled, the second load should come from the cache
+    monkeypatch.setenv("TOPCOFFEA_CACHE_DIR", str(tmp_path))
+    first = corrections.LoadPUprofiles("2017")
+    assert len(list((tmp_path / "pileup").iterdir())) == 1
+    monkeypatch.setattr(corrections.uproot, "open", None)
+    second = corrections.LoadPUprofiles("2017")
+    for key in ["MC", "Data", "DataUp", "DataDo", "MC_edges", "Data_edges"]:
+        assert np.array_equal(first[key], second[key])
+
+
+def test_decompressed_json_cache(tmp_path, monkeypatch):
+    import gzip
+    from topcoffea.modules.correction_cache import decompressed_path, fill_disk_cache
+
+    src = topcoffea_path("data/POG/LUM/2018_UL/puWeights.json.gz")
+
+    # Without the on-disk cache, the original file is used
+    monkeypatch.delenv("TOPCOFFEA_CACHE_DIR", raising=False)
+    assert decompressed_path(src) == src
+
+    monkeypatch.setenv("TOPCOFFEA_CACHE_DIR", str(tmp_path))
+    cached = fill_disk_cache([src])[0]
+    assert cached.startswith(str(tmp_path)) and cached.endswith("puWeights.json")
+    with gzip.open(src, "rb") as f, open(cached, "rb") as g:
+        assert f.read() == g.read()
+    assert decompressed_path(src) == cached
+
+    cache = CorrectionSetCache()
+    assert "Collisions18_UltraLegacy_goldenJSON" in list(cache.get(src).keys())
+
+
+def make_jets(nevents=200, seed=4):
+    import awkward as ak
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 6, nevents)
+    njets = int(np.sum(counts))
+    jets = ak.zip({
+        "pt": rng.uniform(20, 1500, njets).astype(np.float32),
+        "eta": rng.uniform(-2.4, 2.4, njets).astype(np.float32),
+        "hadronFlavour": rng.choice([4, 5], njets).astype(np.int32),
+    })
+    return ak.unflatten(jets, counts)
+
+
+def test_btag_sf_eval_multi():
+    import awkward as ak
+    import numpy as np
+    from topcoffea.modules.corrections import btag_sf_eval, btag_sf_eval_multi
+    from topcoffea.modules.correction_cache import load_correction_set
+
+    jets = make_jets()
+    variations = [("central", "M"), ("up", "M"), ("down", "L"), ("up_correlated", "T")]
+    sfs = btag_sf_eval_multi(jets, variations, "2018", "deepJet_comb")
+    assert ak.fields(sfs) == ["central_M", "up_M", "down_L", "up_correlated_T"]
+
+    ceval = load_correction_set(topcoffea_path("data/POG/BTV/2018_UL/btagging.json.gz"))["deepJet_comb"]
+    for syst, wp in variations:
+        sf = sfs[f"{syst}_{wp}"]
+        assert ak.to_list(ak.num(sf)) == ak.to_list(ak.num(jets))
+        assert ak.to_list(sf) == ak.to_list(btag_sf_eval(jets, wp, "2018", "deepJet_comb", syst))
+        # Check the first jets one by one, including the pt cap at 1000 GeV
+        for jet, jet_sf in list(zip(ak.flatten(jets), ak.flatten(sf)))[:20]:
+            expected = ceval.evaluate(syst, wp, int(jet.hadronFlavour), abs(jet.eta), min(jet.pt, 1000.0))
+            assert np.isclose(jet_sf, expected)
+
+
+def test_method1a_wgt_multi():
+    import awkward as ak
+    import numpy as np
+    from topcoffea.modules.corrections import get_method1a_wgt_singlewp, get_method1a_wgt_doublewp
+    from topcoffea.modules.corrections import get_method1a_wgt_singlewp_multi, get_method1a_wgt_doublewp_multi
+
+    rng = np.random.default_rng(9)
+    jets = make_jets(nevents=300)
+    counts = ak.num(jets)
+    njets = int(ak.sum(counts))
+
+    def jagged(flat):
+        return ak.unflatten(flat, counts)
+
+    effA = jagged(rng.uniform(0.05, 0.5, njets))
+    effB = jagged(rng.uniform(0.5, 0.95, njets))
+    sfsA = [jagged(rng.uniform(0.8, 1.2, njets)) for _ in range(4)]
+    sfsB = [jagged(rng.uniform(0.8, 1.2, njets)) for _ in range(4)]
+    tagger = rng.uniform(size=njets)
+    cutA = jagged(tagger > 0.7)
+    cutB = jagged((tagger > 0.3) & (tagger <= 0.7))
+    cutC = jagged(tagger <= 0.3)
+
+    wgts = get_method1a_wgt_singlewp_multi(effA, sfsA, cutA)
+    assert wgts.shape == (4, len(jets))
+    for i, sf in enumerate(sfsA):
+        assert np.allclose(wgts[i], ak.to_numpy(get_method1a_wgt_singlewp(effA, sf, cutA)))
+
+    # The sfs can also be given as a record or as a stacked array of flat sfs
+    record = ak.zip({f"sf{i}": sf for i, sf in enumerate(sfsA)})
+    assert np.allclose(get_method1a_wgt_singlewp_multi(effA, record, cutA), wgts)
+    stacked = np.stack([ak.to_numpy(ak.flatten(sf)) for sf in sfsA])
+    assert np.allclose(get_method1a_wgt_singlewp_multi(effA, stacked, cutA), wgts)
+
+    pData, pMC = get_method1a_wgt_doublewp_multi(effA, effB, sfsA, sfsB, cutA, cutB, cutC)
+    for i in range(4):
+        expected_data, expected_mc = get_method1a_wgt_doublewp(effA, effB, sfsA[i], sfsB[i], cutA, cutB, cutC)
+        assert np.allclose(pData[i], ak.to_numpy(expected_data))
+        assert np.allclose(pMC, ak.to_numpy(expected_mc))
+
+
+def test_pileup_weighter():
+    import numpy as np
+    from topcoffea.modules.corrections import GetPUSF, GetPileupWeighter
+
+    nTrueInt = np.concatenate([np.random.default_rng(1).uniform(0, 80, 1000), [-5.0, 0.0, 98.9, 99.0, 150.0]])
+    for year in ["2016APV", "2017", "2018", "2022EE"]:
+        weighter = GetPileupWeighter(year)
+        assert GetPileupWeighter(year) is weighter
+        wgts = weighter(nTrueInt)
+        for var in ["nominal", "up", "down"]:
+            assert np.allclose(wgts[var], GetPUSF(nTrueInt, year, var))
+
+    # Years given as int share the same weighter
+    assert GetPileupWeighter(2018) is GetPileupWeighter("2018")
+
+
+def make_weight_events(nevents, nwgts, doc, field, seed=2):
+    import awkward as ak
+    import numpy as np
+
+    rng = np.random.default_rng(seed)
+    counts = np.where(rng.uniform(size=nevents) < 0.1, 0, nwgts)
+    wgts = ak.unflatten(rng.uniform(0.5, 1.5, size=counts.sum()), counts)
+    events = ak.Array({"event": np.arange(nevents)})
+    events[field] = ak.with_parameter(wgts, "__doc__", doc)
+    return events, wgts
+
+
+def test_attach_scale_weights():
+    import awkward as ak
+    import numpy as np
+    from topcoffea.modules.corrections import AttachScaleWeights, get_scale_indices
+
+    facts = ["0.5", "1", "2"]
+    doc = "LHE scale variation weights (w_var / w_nominal); " + ", ".join(
+        f"[{3*i+j}] is renscfact={r}d0 facscfact={f}d0" for i, r in enumerate(facts) for j, f in enumerate(facts)
+    )
+    events, wgts = make_weight_events(200, 9, doc, "LHEScaleWeight")
+    AttachScaleWeights(events)
+    padded = ak.fill_none(ak.pad_none(wgts, 9), 1)
+    assert np.array_equal(ak.to_numpy(events.renormDown), ak.to_numpy(padded[:, 1]))
+    assert np.array_equal(ak.to_numpy(events.factUp), ak.to_numpy(padded[:, 5]))
+    assert np.array_equal(ak.to_numpy(events.renormfactUp), ak.to_numpy(padded[:, 8]))
+    assert ak.all(events.renormfactDown[ak.num(wgts) == 0] == 1)
+
+    # The docstring is only parsed once
+    hits = get_scale_indices.cache_info().hits
+    AttachScaleWeights(make_weight_events(50, 9, doc, "LHEScaleWeight", seed=3)[0])
+    assert get_scale_indices.cache_info().hits == hits + 1
+
+
+def test_attach_ps_weights():
+    import awkward as ak
+    import numpy as np
+    from topcoffea.modules.corrections import AttachPSWeights
+
+    doc = "PS weights (w_var / w_nominal); [0] is ISR=2 FSR=1; [1] is ISR=1 FSR=2; [2] is ISR=0.5 FSR=1; [3] is ISR=1 FSR=0.5"
+    events, wgts = make_weight_events(100, 4, doc, "PSWeight")
+    events = events[ak.num(wgts) > 0]
+    wgts = wgts[ak.num(wgts) > 0]
+    AttachPSWeights(events)
+    for i, key in enumerate(["ISRUp", "FSRUp", "ISRDown", "FSRDown"]):
+        assert np.array_equal(ak.to_numpy(events[key]), ak.to_numpy(wgts[:, i]))
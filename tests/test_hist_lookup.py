@@ -0,0 +1,48 @@
+import numpy as np
+import awkward as ak
+from coffea.lookup_tools import extractor
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.hist_lookup import get_hist_lookup, load_hist_lookups
+
+
+def make_jagged(low, high, nevents=500, seed=1):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 4, nevents)
+    return ak.unflatten(rng.uniform(low, high, counts.sum()), counts)
+
+
+def test_hist_lookup_vs_extractor():
+    checks = [
+        ("data/fromTTH/fakerate/fr_2017_recorrected.root", "FR_mva085_mu_data_comb_recorrected", (5, 120), (0, 2.6)),
+        ("data/leptonSF/elec/egammaEffi2018_3l_EGM2D.root", "EGamma_SF2D", (0, 2.7), (5, 600)),
+        ("data/photonSF/egammaEffi_EGM2D_Pho_Tight_UL16.root", "EGamma_SF2D_err", (-2.6, 2.6), (10, 600)),
+    ]
+    for i, (fname, hname, range_x, range_y) in enumerate(checks):
+        path = topcoffea_path(fname)
+        ext = extractor()
+        ext.add_weight_sets([f"h {hname} {path}", f"h_error {hname}_error {path}"])
+        ext.finalize()
+        evaluator = ext.make_evaluator()
+
+        x = make_jagged(*range_x, seed=i)
+        y = make_jagged(*range_y, seed=i)
+        for name in ["h", "h_error"]:
+            suffix = "_error" if name == "h_error" else ""
+            out = get_hist_lookup(path, hname + suffix)(x, y)
+            assert ak.all(ak.num(out) == ak.num(x))
+            assert np.array_equal(ak.flatten(out), ak.flatten(evaluator[name](x, y)))
+
+        # Flat inputs
+        flat_out = get_hist_lookup(path, hname)(ak.to_numpy(ak.flatten(x)), ak.to_numpy(ak.flatten(y)))
+        assert np.array_equal(flat_out, ak.flatten(get_hist_lookup(path, hname)(x, y)))
+
+
+def test_hist_lookup_1d():
+    path = topcoffea_path("data/photonSF/HasPix_SummaryPlot_UL17.root")
+    lookups = load_hist_lookups(path)
+    assert load_hist_lookups(path) is lookups
+    sf = lookups["LooseID/SF_HasPix_LooseID"]
+    assert len(sf.edges) == 1
+    x = np.array([-1.0, 0.5, 1.5, 100.0])
+    assert np.array_equal(sf(x), sf.values[[0, 0, 1, -1]])
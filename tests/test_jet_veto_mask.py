@@ -0,0 +1,61 @@
+import pytest
+import numpy as np
+import awkward as ak
+import correctionlib
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.jet_veto_mask import JetVetoMask, get_jet_veto_mask, jet_veto_map_dir_map
+
+
+def test_jet_veto_mask_vs_correctionlib():
+    rng = np.random.default_rng(5)
+    for year, map_type in [("2016APV", "jetvetomap"), ("2018", "jetvetomap"), ("2018", "jetvetomap_hem1516"), ("2023BPix", "jetvetomap")]:
+        path = topcoffea_path(f"data/POG/JME/{jet_veto_map_dir_map[year]}/jetvetomaps.json.gz")
+        cset = correctionlib.CorrectionSet.from_file(path)
+        corr = next(iter(cset.values()))
+
+        eta = rng.uniform(-5.19, 5.19, 50000)
+        phi = rng.uniform(-np.pi, np.pi, 50000)
+        expected = corr.evaluate(map_type, eta, phi)
+        mask = get_jet_veto_mask(year, map_type)
+        assert np.array_equal(mask.values(eta, phi), expected)
+        assert np.array_equal(mask.jet_veto(eta, phi), expected > 0)
+        assert mask.jet_veto(eta, phi).any()
+
+        # Jagged jets, per-event veto
+        counts = rng.integers(0, 8, 10000)
+        n = counts.sum()
+        jet_eta = ak.unflatten(eta[:n], counts)
+        jet_phi = ak.unflatten(phi[:n], counts)
+        jet_veto = mask(jet_eta, jet_phi)
+        assert ak.to_list(ak.num(jet_veto)) == ak.to_list(counts)
+        assert np.array_equal(ak.to_numpy(ak.flatten(jet_veto)), expected[:n] > 0)
+        event_veto = mask.event_veto(jet_eta, jet_phi)
+        assert event_veto.dtype == bool
+        assert np.array_equal(event_veto, ak.to_numpy(ak.any(ak.unflatten(expected[:n] > 0, counts), axis=1)))
+
+
+def test_jet_veto_mask_edges():
+    mask = get_jet_veto_mask("2018")
+    assert get_jet_veto_mask("2018") is mask
+    assert get_jet_veto_mask(2018) is mask
+    assert get_jet_veto_mask(2018, "jetvetomap", clamp=False) is mask
+    with pytest.raises(Exception, match="Unknown year"):
+        get_jet_veto_mask(2019)
+    # The maps declare an "error" flow: jets outside of the binning raise, as with correctionlib
+    for eta, phi in [(5.191, 0.0), (-6.0, 0.0), (0.0, float(np.float32(np.pi))), (np.nan, 0.0)]:
+        with pytest.raises(Exception, match="clamp=True"):
+            mask.values(np.array([0.0, eta]), np.array([0.0, phi]))
+    with pytest.raises(Exception, match="eta outside"):
+        mask.event_veto(ak.Array([[0.0], [], [6.0]]), ak.Array([[0.0], [], [0.0]]))
+    # unless they are clamped to the edge bins
+    clamped = get_jet_veto_mask("2018", clamp=True)
+    assert clamped is not mask
+    assert np.array_equal(clamped.values(np.array([6.0, -6.0]), np.array([3.2, -3.2])), mask.values(np.array([5.1, -5.1]), np.array([3.1, -3.1])))
+    assert len(mask.jet_veto(np.array([]), np.array([]))) == 0
+    with pytest.raises(Exception, match="jetvetomap_hem1516"):
+        JetVetoMask(topcoffea_path("data/POG/JME/2018_UL/jetvetomaps.json.gz"), "nonexistent")
+    # Files with several corrections need the name of the correction
+    with pytest.raises(Exception, match="Winter22Run3_RunE_V1"):
+        JetVetoMask(topcoffea_path("data/POG/JME/2022_Prompt/jetvetomaps.json.gz"))
+    assert JetVetoMask(topcoffea_path("data/POG/JME/2022_Prompt/jetvetomaps.json.gz"), correction="Winter22Run3_RunE_V1").lookup.values.shape == (82, 72)
@@ -0,0 +1,36 @@
+import json
+import numpy as np
+import awkward as ak
+from coffea.lumi_tools import LumiMask as CoffeaLumiMask
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.lumi_mask import LumiMask, get_lumi_mask, golden_json_map
+
+
+def test_lumi_mask_vs_coffea():
+    rng = np.random.default_rng(3)
+    for year in ["2016", "2018", "2023", "2024"]:
+        path = topcoffea_path(f"data/goldenJsons/{golden_json_map[year]}")
+        with open(path) as f:
+            runs_in_json = np.array([int(r) for r in json.load(f)])
+
+        # Mostly runs from the json (and the runs in between), with lumis around the certified ranges
+        runs = np.concatenate([rng.choice(runs_in_json, 20000), rng.integers(runs_in_json.min() - 10, runs_in_json.max() + 10, 5000)])
+        lumis = rng.integers(0, 2000, len(runs))
+        mask = get_lumi_mask(year)(runs, lumis)
+        assert mask.dtype == bool
+        assert mask.any()
+        assert np.array_equal(mask, CoffeaLumiMask(path)(runs, lumis))
+        assert np.array_equal(LumiMask(path)(ak.Array(runs), ak.Array(lumis)), mask)
+
+
+def test_lumi_mask_edges():
+    mask = get_lumi_mask("2023")
+    assert get_lumi_mask("2023") is mask
+    assert get_lumi_mask(2023) is mask
+    # "366820": [[40, 411]]
+    runs = np.full(5, 366820)
+    lumis = np.array([39, 40, 200, 411, 412])
+    assert list(mask(runs, lumis)) == [False, True, True, True, False]
+    assert not mask(np.array([1]), np.array([1]))[0]
+    assert len(mask(np.array([], dtype=int), np.array([], dtype=int))) == 0
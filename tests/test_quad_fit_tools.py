@@ -0,0 +1,49 @@
+import numpy as np
+import topcoffea.modules.quad_fit_tools as qft
+
+
+wc_lst = ["ctG", "ctW"]
+coeffs = np.array([1.0, 0.5, 2.0, -0.3, 0.1, 1.5])
+
+
+def eval_by_hand(fit_dict, wcpt_dict):
+    xsec = 0
+    for wc_str, coeff_val in fit_dict.items():
+        wc1, wc2 = wc_str.split("*")
+        wc1_val = 1.0 if wc1 == "sm" else wcpt_dict.get(wc1, 0.0)
+        wc2_val = 1.0 if wc2 == "sm" else wcpt_dict.get(wc2, 0.0)
+        xsec += wc1_val * wc2_val * coeff_val
+    return xsec
+
+
+def test_quad_fit_dict():
+    fit_dict = qft.get_quad_fit_dict(wc_lst, coeffs)
+    assert list(fit_dict.keys()) == qft.get_quad_keys(wc_lst)
+    assert list(fit_dict.values()) == list(coeffs)
+    assert qft.get_1d_fit(fit_dict, "ctW") == [1.0, -0.3, 1.5]
+
+    quad_fit = qft.QuadFit.from_dict(fit_dict)
+    assert quad_fit.wc_names == ["sm"] + wc_lst
+    assert quad_fit.to_dict() == fit_dict
+
+
+def test_eval_fit():
+    fit_dict = qft.get_quad_fit_dict(wc_lst, coeffs)
+    pt = {"ctG": 0.7, "ctW": -1.2}
+    assert abs(qft.eval_fit(fit_dict, pt) - eval_by_hand(fit_dict, pt)) < 1e-12
+    assert abs(qft.eval_fit(fit_dict, {"ctG": 0.7}) - eval_by_hand(fit_dict, {"ctG": 0.7})) < 1e-12
+
+    # Batch of points, given as a dict of arrays or as a (n_pts x n_wc) array
+    rng = np.random.default_rng(2)
+    pts = rng.normal(size=(20, 2))
+    expected = [eval_by_hand(fit_dict, dict(zip(wc_lst, p))) for p in pts]
+    assert np.allclose(qft.eval_fit(fit_dict, {"ctG": pts[:, 0], "ctW": pts[:, 1]}), expected)
+    assert np.allclose(qft.QuadFit(wc_lst, coeffs).eval(pts), expected)
+
+
+def test_find_where_fit_crosses_threshold():
+    params = np.array([[1.0, 0.5, 2.0], [1.0, -0.3, 1.5], [2.0, 0.0, 0.5]])
+    x_m, x_p = qft.find_where_fit_crosses_threshold(params, 4.0)
+    for i, p in enumerate(params):
+        assert np.allclose(qft.find_where_fit_crosses_threshold(p, 4.0), [x_m[i], x_p[i]])
+        assert np.allclose(qft.eval_1d_quad(p, np.array([x_m[i], x_p[i]])), 4.0)
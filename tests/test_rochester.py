@@ -0,0 +1,100 @@
+import pytest
+import numpy as np
+import awkward as ak
+from coffea.lookup_tools import txt_converters, rochester_lookup
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.rochester import get_rochester_corrections
+
+
+def make_muons(nevents=300, seed=1):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 4, nevents)
+    n = counts.sum()
+    pt = rng.uniform(5, 300, n)
+    genpt = np.where(rng.uniform(size=n) < 0.7, pt * rng.normal(1, 0.03, n), np.nan)
+    muons = {
+        "charge": rng.choice([-1, 1], n),
+        "pt": pt,
+        "eta": rng.uniform(-2.6, 2.6, n),
+        "phi": rng.uniform(-np.pi, np.pi, n),
+        "genpt": genpt,
+        "nTrackerLayers": rng.integers(4, 20, n),
+        "u": rng.random(n),
+    }
+    return ak.unflatten(ak.zip(muons), counts)
+
+
+def test_rochester_vs_coffea():
+    ref = rochester_lookup.rochester_lookup(txt_converters.convert_rochester_file(topcoffea_path("data/MuonScale/RoccoR2018UL.txt")))
+    rc = get_rochester_corrections("2018")
+    assert get_rochester_corrections("2018") is rc
+    assert get_rochester_corrections(2018) is rc
+
+    mu = make_muons()
+    kin = (mu.charge, mu.pt, mu.eta, mu.phi)
+    checks = [
+        ("kScaleDT", kin),
+        ("kScaleMC", kin),
+        ("kSpreadMC", kin + (mu.pt * 1.02,)),
+        ("kSmearMC", kin + (mu.nTrackerLayers, mu.u)),
+    ]
+    for name, args in checks:
+        k = getattr(rc, name)(*args)
+        assert ak.all(ak.num(k) == ak.num(mu))
+        assert np.allclose(ak.flatten(k), ak.flatten(getattr(ref, name)(*args)), rtol=0, atol=1e-12)
+
+        # Flat inputs give the same result
+        flat_args = [ak.to_numpy(ak.flatten(x)) for x in args]
+        assert np.array_equal(getattr(rc, name)(*flat_args), ak.to_numpy(ak.flatten(k)))
+
+    # Other sets and members, and the uncertainties of the scale corrections
+    assert np.allclose(ak.flatten(rc.kScaleDT(*kin, s=1, m=17)), ak.flatten(ref.kScaleDT(*kin, 1, 17)), rtol=0, atol=1e-12)
+    assert np.allclose(ak.flatten(rc.kScaleDTerror(*kin)), ak.flatten(ref.kScaleDTerror(*kin)), rtol=0, atol=1e-12)
+
+
+def test_rochester_errors():
+    rc = get_rochester_corrections("2017")
+    mu = make_muons(50, seed=4)
+    args = (mu.charge, mu.pt, mu.eta, mu.phi, mu.nTrackerLayers, mu.u)
+
+    # rms over the members of each set, summed in quadrature over the sets
+    nom = ak.to_numpy(ak.flatten(rc.kSmearMC(*args)))
+    sum2 = np.zeros_like(nom)
+    for s, nmem in enumerate(rc.nmem):
+        for m in range(nmem):
+            sum2 += (ak.to_numpy(ak.flatten(rc.kSmearMC(*args, s=s, m=m))) - nom) ** 2 / nmem
+    assert np.allclose(ak.flatten(rc.kSmearMCerror(*args)), np.sqrt(sum2))
+
+
+def test_rochester_muon_corrections():
+    rc = get_rochester_corrections("2016APV")
+    mu = make_muons(seed=2)
+    mu["matched_gen"] = ak.zip({"pt": mu.genpt})
+
+    nevents = len(mu)
+    event_ids = {
+        "run": np.full(nevents, 316187, dtype=np.uint32),
+        "lumi": (np.arange(nevents) // 50 + 1).astype(np.uint32),
+        "event": np.arange(nevents, dtype=np.uint64) * 7919 + (1 << 33),
+    }
+    k1, err = rc.muon_corrections(mu, is_data=False, **event_ids, error=True)
+    k2 = rc.muon_corrections(mu, is_data=False, **event_ids)
+    assert ak.all(k1 == k2)
+    assert ak.all(err >= 0)
+    with pytest.raises(Exception, match="run, lumi and event"):
+        rc.muon_corrections(mu, is_data=False)
+
+    # The random numbers of a muon do not depend on the other events of the chunk
+    chunks = [rc.muon_corrections(mu[start:start + 70], is_data=False, **{k: v[start:start + 70] for k, v in event_ids.items()}) for start in range(0, nevents, 70)]
+    assert ak.all(ak.concatenate(chunks) == k1)
+
+    # Matched muons are spread (no dependence on the random numbers), the others are smeared
+    k3 = rc.muon_corrections(mu, is_data=False, **dict(event_ids, event=event_ids["event"] + 1))
+    matched = ~np.isnan(mu.genpt)
+    assert ak.all((k1 == k3)[matched])
+    assert not ak.all((k1 == k3)[~matched])
+    assert np.allclose(ak.flatten(k1[matched]), ak.flatten(rc.kSpreadMC(mu.charge, mu.pt, mu.eta, mu.phi, mu.genpt)[matched]))
+
+    kdata = rc.muon_corrections(mu, is_data=True)
+    assert ak.all(kdata == rc.kScaleDT(mu.charge, mu.pt, mu.eta, mu.phi))
@@ -0,0 +1,176 @@
+import numpy as np
+import pytest
+from topcoffea.modules.WCPoint import WCPoint, WCPointSet
+from topcoffea.modules.WCFit import WCFit, FitEventWeights
+
+
+wc_names = ["ctG", "ctW", "ctZ"]
+
+
+def make_fit(tag="f", npts=20, seed=3):
+    rng = np.random.default_rng(seed)
+    pts = []
+    for _ in range(npts):
+        pts.append(WCPoint(dict(zip(wc_names, rng.normal(size=len(wc_names)))), wgt=rng.uniform()))
+    return WCFit(pts, tag)
+
+
+def eval_by_hand(fit, pt_dict):
+    # Straightforward term by term evaluation of the quadratic, used as a reference
+    v = 0.0
+    for (i, j), c in zip(fit.GetPairs(), fit.GetCoefficients()):
+        n1, n2 = fit.GetNames()[i], fit.GetNames()[j]
+        x1 = 1.0 if n1 == "sm" else pt_dict.get(n1, 0.0)
+        x2 = 1.0 if n2 == "sm" else pt_dict.get(n2, 0.0)
+        v += x1 * x2 * c
+    return v
+
+
+def test_wcfit_layout():
+    fit = make_fit()
+    n = len(wc_names) + 1
+    assert fit.GetNames() == ["sm"] + wc_names
+    assert fit.Size() == n * (n + 1) // 2
+    assert fit.ErrSize() == fit.Size() * (fit.Size() + 1) // 2
+    assert [tuple(p) for p in fit.GetPairs()[:4]] == [(0, 0), (1, 0), (1, 1), (2, 0)]
+    assert [tuple(p) for p in fit.GetErrorPairs()[:4]] == [(0, 0), (1, 0), (1, 1), (2, 0)]
+
+
+def test_wcfit_eval_batch():
+    fit = make_fit()
+    rng = np.random.default_rng(7)
+    vals = rng.normal(size=(50, len(wc_names)))
+
+    batch = fit.EvalPoint(vals)
+    batch_err = fit.EvalPointError(vals)
+    assert batch.shape == (50,)
+    for i, v in enumerate(vals):
+        pt = WCPoint(dict(zip(wc_names, v)))
+        assert abs(batch[i] - eval_by_hand(fit, pt.inputs)) < 1e-10
+        assert abs(batch[i] - fit.EvalPoint(pt)) < 1e-10
+        assert abs(batch_err[i] - fit.EvalPointError(pt)) < 1e-10
+
+    # The dict and list of WCPoint forms should agree with the array form
+    as_dict = fit.EvalPoint({n: vals[:, i] for i, n in enumerate(wc_names)})
+    as_pts = fit.EvalPoint([WCPoint(dict(zip(wc_names, v))) for v in vals])
+    assert np.allclose(as_dict, batch)
+    assert np.allclose(as_pts, batch)
+
+    # A single WC can be given by name
+    assert abs(fit.EvalPoint("ctW", 2.0) - eval_by_hand(fit, {"ctW": 2.0})) < 1e-10
+    # together with an array of values
+    scan = fit.EvalPoint("ctW", vals[:, 1])
+    assert scan.shape == (50,)
+    assert np.allclose(scan, [eval_by_hand(fit, {"ctW": v}) for v in vals[:, 1]])
+
+
+def test_wcfit_add_and_scale():
+    fit = make_fit()
+    chk_pt = WCPoint(dict(zip(wc_names, [0.3, -1.0, 2.0])))
+
+    summed = WCFit(tag="sum")
+    for _ in range(4):
+        summed.AddFit(fit)
+    assert abs(summed.EvalPoint(chk_pt) - 4 * fit.EvalPoint(chk_pt)) < 1e-10
+    assert abs(summed.EvalPointError(chk_pt) - 2 * fit.EvalPointError(chk_pt)) < 1e-10
+
+    # Scaling by s scales the fit by s and the error fit by s^2
+    summed.Scale(0.25)
+    assert abs(summed.EvalPoint(chk_pt) - fit.EvalPoint(chk_pt)) < 1e-10
+    assert abs(summed.EvalPointError(chk_pt) - 0.5 * fit.EvalPointError(chk_pt)) < 1e-10
+
+
+def test_set_names():
+    fit = make_fit()
+    coeffs = fit.GetCoefficients().copy()
+    # Extending keeps the existing coefficients, and the new terms are 0
+    fit.SetNames(fit.GetNames() + ["ctp"])
+    assert np.array_equal(fit.GetCoefficients()[:len(coeffs)], coeffs)
+    assert not fit.GetCoefficients()[len(coeffs):].any()
+    # Relabeling or dropping names is not allowed
+    with pytest.raises(ValueError, match="prefix"):
+        fit.SetNames(["sm", "ctW", "ctG", "ctZ", "ctp"])
+    with pytest.raises(ValueError, match="prefix"):
+        fit.SetNames(["sm", "ctG"])
+    assert np.array_equal(fit.GetCoefficients()[:len(coeffs)], coeffs)
+
+
+def test_fit_event_weights():
+    rng = np.random.default_rng(11)
+    nevents = 25
+    grid = rng.normal(size=(15, len(wc_names)))
+    grid_pts = [WCPoint(dict(zip(wc_names, v))) for v in grid]
+
+    # Build per-event weights from known quadratics so that the fits are exact
+    truth = [WCFit(names=wc_names, coeffs=list(rng.normal(size=10))) for _ in range(nevents)]
+    wgts = np.array([fit.EvalPoint(grid) for fit in truth])
+
+    coeffs = FitEventWeights(wgts, grid_pts, chunk_size=7)
+    assert coeffs.shape == (nevents, 10)
+    for i in range(nevents):
+        assert np.allclose(coeffs[i], truth[i].GetCoefficients())
+
+        # Should be the same as fitting each event on its own
+        pts = [WCPoint(dict(zip(wc_names, v)), wgt=w) for v, w in zip(grid, wgts[i])]
+        assert np.allclose(coeffs[i], WCFit(pts).GetCoefficients())
+
+    # The grid can also be given as an array
+    assert np.allclose(FitEventWeights(wgts, grid, names=wc_names), coeffs)
+    # and the weights as nested lists
+    assert np.allclose(FitEventWeights(wgts.tolist(), grid_pts), coeffs)
+    # A single event must still be given as a (1 x n_points) array
+    assert np.allclose(FitEventWeights(wgts[:1], grid_pts), coeffs[:1])
+    with pytest.raises(ValueError, match="n_events x n_points"):
+        FitEventWeights(wgts[0], grid_pts)
+
+
+def test_wcpointset():
+    ids = ["EFTrwgt0_ctG_0.0_ctW_0.0_ctZ_0.0", "EFTrwgt1_ctG_1.5_ctW_-2.0_ctZ_0.5", "EFTrwgt2_ctG_0.0_ctW_3.0_ctZ_0.0"]
+    pts = WCPointSet.FromRwgtIds(ids, wgts=[1.0, 2.0, 3.0])
+    assert pts.GetNames() == wc_names
+    assert len(pts) == 3
+    assert list(pts.idnums) == [0, 1, 2]
+    assert np.array_equal(pts.GetStrength("ctW"), [0.0, -2.0, 3.0])
+    assert np.array_equal(pts.GetDim(), [0, 3, 1])
+    assert np.array_equal(pts.IsSMPoint(), [True, False, False])
+    assert np.allclose(pts.GetEuclideanDistance(), [WCPoint(s).GetEuclideanDistance() for s in ids])
+    assert pts.FindPoint(WCPoint(ids[2])) == 2
+    assert pts.FindPoint({"ctG": 5.0}) == -1
+
+    # The per-string parsing is used as a fallback, and should agree with the vectorized one
+    mixed = WCPointSet.FromRwgtIds(ids + ["EFTrwgt3_ctZ_1.0_ctG_2.0_ctW_0.0"])
+    assert np.array_equal(mixed.GetValues()[:3], pts.GetValues())
+    assert np.array_equal(mixed.GetValues()[3], [2.0, 0.0, 1.0])
+    assert mixed[3].IsEqualTo(WCPoint("EFTrwgt3_ctZ_1.0_ctG_2.0_ctW_0.0"))
+
+    # Fits from a WCPointSet and from the equivalent list of WCPoints should agree
+    fit = make_fit()
+    grid = WCPointSet(np.random.default_rng(5).normal(size=(12, 3)), wc_names)
+    grid.wgts = fit.EvalPoint(grid)
+    assert np.allclose(WCFit(grid).GetCoefficients(), fit.GetCoefficients())
+    assert np.allclose(WCFit([grid[i] for i in range(len(grid))]).GetCoefficients(), fit.GetCoefficients())
+
+
+def test_wcfit_lookup():
+    fit = make_fit()
+    names = fit.GetNames()
+    for idx, (i, j) in enumerate(fit.GetPairs()):
+        assert fit.GetIndexPair(names[i], names[j]) == (i, j)
+        assert fit.GetIndexPair((names[j], names[i])) == (i, j)
+        assert fit.GetCoefficient(names[i], names[j]) == fit.GetCoefficient(idx)
+        assert fit.GetCoefficient(names[j], names[i]) == fit.GetCoefficient(idx)
+    assert fit.GetIndexPair("ctG", "cpt") == (-1, -1)
+    assert fit.GetCoefficient("ctG", "cpt") == 0.0
+
+    # The look up tables should follow the fit when it is extended or copied
+    fit.Extend("cpt")
+    assert fit.HasCoefficient("cpt")
+    assert fit.GetIndexPair("ctG", "cpt") == (4, 1)
+    assert fit.GetCoefficient("ctG", "cpt") == 0.0
+    copied = WCFit()
+    copied.AddFit(fit)
+    assert copied.GetCoefficient("ctW", "ctG") == fit.GetCoefficient("ctW", "ctG")
+
+    serialized = fit.Serialize()
+    assert [p for p, _ in serialized["coeffs"]] == [tuple(p) for p in fit.GetPairs()]
+    assert np.allclose([c for _, c in serialized["errs"]], fit.GetErrorCoefficients())
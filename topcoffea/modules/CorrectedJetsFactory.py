@@ -1,12 +1,16 @@
 import awkward
+import numba
 import numpy
 import warnings
-from functools import partial, reduce
+from functools import partial
+from collections.abc import MutableMapping
 import operator
 from topcoffea.modules.JECStack import JECStack
+from topcoffea.modules.counter_rng import counter_rand_gauss
 
 _stack_parts = ["jec", "junc", "jer", "jersf"]
-_MIN_JET_ENERGY = numpy.array(1e-2, dtype=numpy.float32)
+_rng_key_names = ["Run", "LumiBlock", "Event"]
+_MIN_JET_ENERGY = numpy.float32(1e-2)
 _ONE_F32 = numpy.array(1.0, dtype=numpy.float32)
 _ZERO_F32 = numpy.array(0.0, dtype=numpy.float32)
 _JERSF_FORM = {
@@ -17,35 +21,31 @@ _JERSF_FORM = {
     "primitive": "float32",
 }
 
-def rewrap_recordarray(layout, depth, data):
-    if isinstance(layout, awkward.layout.RecordArray):
-        return lambda: data
-    return None
-
-def awkward_rewrap(arr, like_what, gfunc):
-    behavior = awkward._util.behaviorof(like_what)
-    func = partial(gfunc, data=arr.layout)
-    layout = awkward.operations.convert.to_layout(like_what)
-    newlayout = awkward._util.recursively_apply(layout, func)
-    return awkward._util.wrap(newlayout, behavior=behavior)
-
 def rand_gauss(item, randomstate):
-    def getfunction(layout, depth):
-        if isinstance(layout, awkward.layout.NumpyArray) or not isinstance(
-            layout, (awkward.layout.Content, awkward.partition.PartitionedArray)
-        ):
-            return lambda: awkward.layout.NumpyArray(
-                randomstate.normal(size=len(layout)).astype(numpy.float32)
-            )
-        return None
-    out = awkward._util.recursively_apply(
-        awkward.operations.convert.to_layout(item), getfunction
-    )
-    assert out is not None
-    return awkward._util.wrap(out, awkward._util.behaviorof(item))
+    """Gaussian random numbers (float32), one for each entry of the flat array item"""
+    return awkward.Array(randomstate.normal(size=len(item)).astype(numpy.float32))
+
+@numba.njit
+def _jer_smear_kernel(pt_gen, jetPt, etaJet, jet_energy_resolution, jet_resolution_rand_gauss, jet_energy_resolution_scale_factor, out):
+    one = numpy.float32(1)
+    zero = numpy.float32(0)
+    for i in range(len(jetPt)):
+        pt = jetPt[i]
+        jer = jet_energy_resolution[i]
+        deltaPtRel = (pt - pt_gen[i]) / pt
+        doHybrid = (pt_gen[i] > zero) and (abs(deltaPtRel) < numpy.float32(3) * jer)
+        min_jet_pt = _MIN_JET_ENERGY / numpy.float32(numpy.cosh(etaJet[i]))
+        for variation in range(3):
+            jersf = jet_energy_resolution_scale_factor[i, variation]
+            if doHybrid:
+                smearfact = one + (jersf - one) * deltaPtRel
+            else:
+                smearfact = one + numpy.float32(numpy.sqrt(max(jersf * jersf - one, zero))) * (jer * jet_resolution_rand_gauss[i])
+            if smearfact * pt < min_jet_pt:
+                smearfact = min_jet_pt / pt
+            out[variation, i] = smearfact
 
-def jer_smear(
-    variation,
+def jer_smear_variations(
     forceStochastic,
     pt_gen,
     jetPt,
@@ -54,38 +54,66 @@ def jer_smear(
     jet_resolution_rand_gauss,
     jet_energy_resolution_scale_factor,
 ):
-    pt_gen = pt_gen if not forceStochastic else None
-    if not isinstance(jetPt, awkward.highlevel.Array):
-        raise Exception("'jetPt' must be an awkward array of some kind!")
-    if forceStochastic:
-        pt_gen = awkward.without_parameters(awkward.zeros_like(jetPt))
-
-    jersmear = jet_energy_resolution * jet_resolution_rand_gauss
-    jersf = jet_energy_resolution_scale_factor[:, variation]
-    deltaPtRel = (jetPt - pt_gen) / jetPt
-    doHybrid = (pt_gen > 0) & (numpy.abs(deltaPtRel) < 3 * jet_energy_resolution)
-    detSmear = 1 + (jersf - 1) * deltaPtRel
-    stochSmear = 1 + numpy.sqrt(numpy.maximum(jersf**2 - 1, 0)) * jersmear
-
-    min_jet_pt = _MIN_JET_ENERGY / numpy.cosh(etaJet)
-    min_jet_pt_corr = min_jet_pt / jetPt
-    smearfact = awkward.where(doHybrid, detSmear, stochSmear)
-    smearfact = awkward.where(
-        (smearfact * jetPt) < min_jet_pt, min_jet_pt_corr, smearfact
+    """
+    Returns the (3 x n_jets) float32 JER smearing factors of the nominal, up and down scale factors,
+    computed together in a single pass over the flat jet columns.
+    """
+    def as_f32(array):
+        return numpy.ascontiguousarray(awkward.to_numpy(array), dtype=numpy.float32)
+
+    jetPt = as_f32(jetPt)
+    pt_gen = numpy.zeros_like(jetPt) if forceStochastic else as_f32(pt_gen)
+    out = numpy.empty((3, len(jetPt)), dtype=numpy.float32)
+    _jer_smear_kernel(
+        pt_gen,
+        jetPt,
+        as_f32(etaJet),
+        as_f32(jet_energy_resolution),
+        as_f32(jet_resolution_rand_gauss),
+        as_f32(jet_energy_resolution_scale_factor),
+        out,
     )
+    return out
 
-    def getfunction(layout, depth):
-        if isinstance(layout, awkward.layout.NumpyArray) or not isinstance(
-            layout, (awkward.layout.Content, awkward.partition.PartitionedArray)
-        ):
-            return lambda: awkward.layout.NumpyArray(smearfact)
-        return None
+def jer_smear(variation, forceStochastic, *args):
+    """JER smearing factors of one variation (0: nominal, 1: up, 2: down), see jer_smear_variations"""
+    return awkward.Array(jer_smear_variations(forceStochastic, *args)[variation])
 
-    smearfact = awkward._util.recursively_apply(
-        awkward.operations.convert.to_layout(jetPt), getfunction
-    )
-    smearfact = awkward._util.wrap(smearfact, awkward._util.behaviorof(jetPt))
-    return smearfact
+class LazyCache(MutableMapping):
+    """
+    Wraps a plain dict used as the cache of the VirtualArrays, since the awkward caches only
+    keep a weak reference to their mapping and dicts cannot be weak referenced
+    """
+
+    def __init__(self, base):
+        self.base = base
+
+    @classmethod
+    def maybe_wrap(cls, mapping):
+        return cls(mapping) if type(mapping) is dict else mapping
+
+    def __getitem__(self, key):
+        return self.base[key]
+
+    def __setitem__(self, key, value):
+        self.base[key] = value
+
+    def __delitem__(self, key):
+        del self.base[key]
+
+    def __iter__(self):
+        return iter(self.base)
+
+    def __len__(self):
+        return len(self.base)
+
+def rewrap_like(flat, like_what):
+    """Splits a flat array back into the lists of like_what (flattened along axis 1),
+    keeping the parameters of the lists and the behavior"""
+    out = awkward.unflatten(flat, awkward.num(like_what, axis=1))
+    for key, value in like_what.layout.parameters.items():
+        out = awkward.with_parameter(out, key, value)
+    return out
 
 # Wrapper function to apply jec corrections
 def rawvar_jec(jecval, rawvar, lazy_cache):
@@ -95,14 +123,35 @@ def rawvar_jec(jecval, rawvar, lazy_cache):
         cache=lazy_cache,
     )
 
-def get_corr_inputs(jets, corr_obj, name_map, cache=None, corrections=None):
+def get_flat_column(columns, name, column_cache, dtype=numpy.float32):
+    """
+    Returns a flattened input column as a contiguous numpy array,
+    converting it only once per column (and dtype) for a given cache.
+    """
+    column = columns[name]
+    key = (name, dtype)
+    entry = column_cache.get(key)
+    # The entry is rebuilt if the column has been replaced since it was cached
+    if entry is None or entry[0] is not column:
+        entry = (column, numpy.ascontiguousarray(awkward.to_numpy(column), dtype=dtype))
+        column_cache[key] = entry
+    return entry[1]
+
+def get_corr_inputs(jets, corr_obj, name_map, cache=None, corrections=None, column_cache=None):
     """
     Helper function for getting values of input variables
     given a dictionary and a correction object.
+    If a column_cache dictionary is given, jets is a dictionary of flattened jet columns,
+    and each of them is converted (real inputs to float32) only once for all of the calls sharing the cache.
     """
 
+    def get_input(inp):
+        if column_cache is None:
+            return awkward.flatten(jets[name_map[inp.name]])
+        return get_flat_column(jets, name_map[inp.name], column_cache, numpy.float32 if inp.type == "real" else None)
+
     if corrections is None:
-        input_values = [awkward.flatten(jets[name_map[inp.name]]) for inp in corr_obj.inputs if (inp.name != "systematic")]
+        input_values = [get_input(inp) for inp in corr_obj.inputs if (inp.name != "systematic")]
     else:
         ## This is needed to propagate the previous level of corrections, before applying the next one
         input_values = []
@@ -110,16 +159,25 @@ def get_corr_inputs(jets, corr_obj, name_map, cache=None, corrections=None):
             if inp.name == "systematic":
                 continue
             elif inp.name == "JetPt":
-                rawvar = awkward.flatten(jets[name_map[inp.name]])
+                rawvar = get_input(inp)
                 init_input_value = partial(rawvar_jec, rawvar=rawvar, lazy_cache=cache)
                 input_value = init_input_value(jecval=corrections)
             else:
-                input_value = awkward.flatten(jets[name_map[inp.name]])
+                input_value = get_input(inp)
             input_values.append(input_value)
     return input_values
 
 
 class CorrectedJetsFactory(object):
+    """
+    Builds the corrected jets from a JECStack.
+    name_map maps the names of the inputs (e.g. "JetPt", "ptRaw", "Rho") to the fields of the jets.
+    The "Run", "LumiBlock" and "Event" entries are needed for JER smearing random numbers that do not
+    depend on the chunking: these fields must already be broadcast to the jets, e.g.
+    jets["event"] = awkward.broadcast_arrays(events.event, jets.pt)[0]
+    Without them, the random numbers are seeded from the jets of each chunk.
+    """
+
     def __init__(self, name_map, jec_stack):
         if not isinstance(jec_stack, JECStack):
             raise TypeError("jec_stack must be an instance of JECStack")
@@ -159,6 +217,14 @@ class CorrectedJetsFactory(object):
             )
             self.forceStochastic = True
 
+        # The JER smearing random numbers are keyed by (run, lumi, event, jet index) if the jets have these fields
+        self.counter_rng = all(name_map.get(name) is not None for name in _rng_key_names)
+        if not self.counter_rng:
+            warnings.warn(
+                f"There is no name mapping for {_rng_key_names},"
+                " the JER smearing random numbers will be seeded from the jets of each chunk (and depend on the chunking)!"
+            )
+
     def load_corrections_clib(self):
         """Load the corrections from correctionlib using the json_path in JECStack."""
         self.corrections = self.jec_stack.corrections
@@ -182,25 +248,36 @@ class CorrectedJetsFactory(object):
                 " Please supply mappings for these variables!"
             )
 
-    def build(self, jets, lazy_cache):
+    def build(self, jets, lazy_cache, systematics=None):
+        """
+        Returns the corrected jets, with their JER and JES systematic variations.
+        systematics is the list of variations to build (e.g. ["JER", "JES_FlavorQCD"]), all of them by default.
+        The variation records are only built when they are accessed.
+        """
         if lazy_cache is None:
             raise Exception("CorrectedJetsFactory requires an awkward-array cache to function correctly.")
-        lazy_cache = awkward._util.MappingProxy.maybe_wrap(lazy_cache)
+        lazy_cache = LazyCache.maybe_wrap(lazy_cache)
         if not isinstance(jets, awkward.highlevel.Array):
             raise Exception("'jets' must be an awkward > 1.0.0 array of some kind!")
 
+        def is_requested(name):
+            return systematics is None or name in systematics
+        available_systematics = []
+
         # THESE ARE THE ATTRIBUTES OF THE JET COLLECTION
         fields = awkward.fields(jets)
         if len(fields) == 0:
             raise Exception("Empty record, please pass a jet object with at least {self.real_sig} defined!")
 
         out = awkward.flatten(jets)
-        wrap = partial(awkward_rewrap, like_what=jets, gfunc=rewrap_recordarray)
         scalar_form = awkward.without_parameters(out[self.name_map["ptRaw"]]).layout.form
 
         in_dict = {field: out[field] for field in fields}
         out_dict = dict(in_dict)
 
+        # Flattened numpy copies of the correction inputs, shared by all of the clib corrections of this build
+        column_cache = {}
+
         # Add original values
         out_dict[self.name_map["JetPt"] + "_orig"] = out_dict[self.name_map["JetPt"]]
         out_dict[self.name_map["JetMass"] + "_orig"] = out_dict[self.name_map["JetMass"]]
@@ -226,25 +303,19 @@ class CorrectedJetsFactory(object):
                 total_correction = awkward.ones_like(out_dict[self.name_map["JetPt"]])
 
         elif self.tool == "clib":
-            corrections_list = []
-
             for lvl in self.jec_stack.jec_names_clib:
-                cumCorr = None
-                if len(corrections_list) > 0:
-                    ones = numpy.ones_like(corrections_list[-1], dtype=numpy.float32)
-                    cumCorr = reduce(lambda x, y: y * x, corrections_list, ones).astype(dtype=numpy.float32)
-
                 sf = self.corrections.get(lvl, None)
                 if sf is None:
                     raise ValueError(f"Correction {lvl} not found in self.corrections")
 
                 ## This automatically apply the previous levels of correction, when needed
-                inputs = get_corr_inputs(jets=jets, corr_obj=sf, name_map=jec_name_map, cache=lazy_cache, corrections=cumCorr)
+                ## (total_correction is the running product of the levels evaluated so far)
+                inputs = get_corr_inputs(jets=out_dict, corr_obj=sf, name_map=jec_name_map, cache=lazy_cache, corrections=total_correction, column_cache=column_cache)
                 correction = sf.evaluate(*inputs).astype(dtype=numpy.float32)
-                corrections_list.append(correction)
                 if total_correction is None:
-                    total_correction = numpy.ones_like(correction, dtype=numpy.float32)
-                total_correction *= correction
+                    total_correction = correction.copy()
+                else:
+                    total_correction *= correction
 
                 if self.jec_stack.savecorr:
                     jec_lvl_tag = "_jec_" + lvl
@@ -321,31 +392,18 @@ class CorrectedJetsFactory(object):
                 )
 
             elif self.tool == "clib":
-                # Prepare for clib-based corrections
-                jer_out_parms = out.layout.parameters
-                jer_out_parms["corrected"] = True
-                jer_out = awkward.zip(
-                    out_dict, depth_limit=1, parameters=jer_out_parms, behavior=out.behavior
-                )
-                jerjets = wrap(jer_out)
-
                 for jer_entry in self.jec_stack.jer_names_clib:
                     outtag = "jet_energy_resolution"
                     jer_entry = jer_entry.replace("SF", "ScaleFactor")
                     sf = self.corrections[jer_entry]
-                    inputs = get_corr_inputs(jets=jerjets, corr_obj=sf, name_map=jer_name_map)
+                    inputs = get_corr_inputs(jets=out_dict, corr_obj=sf, name_map=jer_name_map, column_cache=column_cache)
                     if "ScaleFactor" in jer_entry:
                         outtag += "_scale_factor"
-                        correction = awkward.Array([
-                            sf.evaluate(*inputs, "nom").astype(dtype=numpy.float32),
-                            sf.evaluate(*inputs, "up").astype(dtype=numpy.float32),
-                            sf.evaluate(*inputs, "down").astype(dtype=numpy.float32),
-                        ])
-                        correction = awkward.concatenate([
-                            correction[0][:, numpy.newaxis],
-                            correction[1][:, numpy.newaxis],
-                            correction[2][:, numpy.newaxis]
-                        ], axis=1)
+                        # (n_jets x 3) nom/up/down block, with the inner shape of _JERSF_FORM
+                        correction = numpy.empty((len(out), 3), dtype=numpy.float32)
+                        for i, variation in enumerate(["nom", "up", "down"]):
+                            correction[:, i] = sf.evaluate(*inputs, variation)
+                        correction = awkward.Array(correction)
                     else:
                         correction = awkward.Array(
                             sf.evaluate(*inputs).astype(dtype=numpy.float32),
@@ -353,34 +411,54 @@ class CorrectedJetsFactory(object):
 
                     out_dict[outtag] = correction
 
-                del jerjets
-
             # Gaussian smearing
-            seeds = numpy.array(out_dict[self.name_map["JetPt"] + "_orig"])[[0, -1]].view("i4")
-            out_dict["jet_resolution_rand_gauss"] = awkward.virtual(
-                rand_gauss,
-                args=(
-                    out_dict[self.name_map["JetPt"] + "_orig"],
-                    numpy.random.Generator(numpy.random.PCG64(seeds)),
-                ),
-                cache=lazy_cache,
-                length=len(out),
-                form=scalar_form,
+            if self.counter_rng:
+                out_dict["jet_resolution_rand_gauss"] = awkward.virtual(
+                    counter_rand_gauss,
+                    args=(
+                        out_dict[self.name_map["Run"]],
+                        out_dict[self.name_map["LumiBlock"]],
+                        out_dict[self.name_map["Event"]],
+                        jets,
+                    ),
+                    cache=lazy_cache,
+                    length=len(out),
+                    form=scalar_form,
+                )
+            else:
+                seeds = numpy.array(out_dict[self.name_map["JetPt"] + "_orig"])[[0, -1]].view("i4")
+                out_dict["jet_resolution_rand_gauss"] = awkward.virtual(
+                    rand_gauss,
+                    args=(
+                        out_dict[self.name_map["JetPt"] + "_orig"],
+                        numpy.random.Generator(numpy.random.PCG64(seeds)),
+                    ),
+                    cache=lazy_cache,
+                    length=len(out),
+                    form=scalar_form,
+                )
+
+            # The nominal, up and down smearing factors are computed together, when one of them is first accessed
+            jer_smear_args = (
+                self.forceStochastic,
+                None if self.forceStochastic else out_dict[jer_name_map["ptGenJet"]],
+                out_dict[jer_name_map["JetPt"]],
+                out_dict[jer_name_map["JetEta"]],
+                out_dict["jet_energy_resolution"],
+                out_dict["jet_resolution_rand_gauss"],
+                out_dict["jet_energy_resolution_scale_factor"],
             )
+            jer_smear_factors = {}
+
+            def jer_smear_factor(variation):
+                if "factors" not in jer_smear_factors:
+                    jer_smear_factors["factors"] = jer_smear_variations(*jer_smear_args)
+                return awkward.Array(jer_smear_factors["factors"][variation])
 
             init_jerc = partial(
                 awkward.virtual,
-                jer_smear,
-                args=(
-                    0,
-                    self.forceStochastic,
-                    awkward.values_astype(out_dict[jer_name_map["ptGenJet"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetPt"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetEta"]], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_resolution_rand_gauss"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution_scale_factor"], numpy.float32),
-                ),
+                jer_smear_factor,
+                args=(0,),
                 cache=lazy_cache,
             )
             out_dict["jet_energy_resolution_correction"] = init_jerc(length=len(out), form=scalar_form)
@@ -404,95 +482,82 @@ class CorrectedJetsFactory(object):
             out_dict[self.name_map["JetPt"] + "_jer"] = out_dict[self.name_map["JetPt"]]
             out_dict[self.name_map["JetMass"] + "_jer"] = out_dict[self.name_map["JetMass"]]
 
-            # JER systematics
-            jerc_up = partial(
-                awkward.virtual,
-                jer_smear,
-                args=(
-                    1,
-                    self.forceStochastic,
-                    awkward.values_astype(out_dict[jer_name_map["ptGenJet"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetPt"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetEta"]], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_resolution_rand_gauss"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution_scale_factor"], numpy.float32),
-                ),
-                cache=lazy_cache,
-            )
-            up = awkward.flatten(jets)
-            up["jet_energy_resolution_correction"] = jerc_up(
-                length=len(out), form=scalar_form
-            )
-            init_pt_jer = partial(
-                awkward.virtual,
-                operator.mul,
-                args=(
-                    up["jet_energy_resolution_correction"],
-                    out_dict[jer_name_map["JetPt"]],
-                ),
-                cache=lazy_cache,
-            )
-            init_mass_jer = partial(
-                awkward.virtual,
-                operator.mul,
-                args=(
-                    up["jet_energy_resolution_correction"],
-                    out_dict[jer_name_map["JetMass"]],
-                ),
-                cache=lazy_cache,
-            )
-            up[self.name_map["JetPt"]] = init_pt_jer(length=len(out), form=scalar_form)
-            up[self.name_map["JetMass"]] = init_mass_jer(
-                length=len(out), form=scalar_form
-            )
+            # JER systematics (only built when they are accessed)
+            def build_jer_variant():
+                jerc_up = partial(
+                    awkward.virtual,
+                    jer_smear_factor,
+                    args=(1,),
+                    cache=lazy_cache,
+                )
+                up = awkward.flatten(jets)
+                up["jet_energy_resolution_correction"] = jerc_up(
+                    length=len(out), form=scalar_form
+                )
+                init_pt_jer = partial(
+                    awkward.virtual,
+                    operator.mul,
+                    args=(
+                        up["jet_energy_resolution_correction"],
+                        out_dict[jer_name_map["JetPt"]],
+                    ),
+                    cache=lazy_cache,
+                )
+                init_mass_jer = partial(
+                    awkward.virtual,
+                    operator.mul,
+                    args=(
+                        up["jet_energy_resolution_correction"],
+                        out_dict[jer_name_map["JetMass"]],
+                    ),
+                    cache=lazy_cache,
+                )
+                up[self.name_map["JetPt"]] = init_pt_jer(length=len(out), form=scalar_form)
+                up[self.name_map["JetMass"]] = init_mass_jer(
+                    length=len(out), form=scalar_form
+                )
 
-            jerc_down = partial(
-                awkward.virtual,
-                jer_smear,
-                args=(
-                    2,
-                    self.forceStochastic,
-                    awkward.values_astype(out_dict[jer_name_map["ptGenJet"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetPt"]], numpy.float32),
-                    awkward.values_astype(out_dict[jer_name_map["JetEta"]], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_resolution_rand_gauss"], numpy.float32),
-                    awkward.values_astype(out_dict["jet_energy_resolution_scale_factor"], numpy.float32),
-                ),
-                cache=lazy_cache,
-            )
-            down = awkward.flatten(jets)
-            down["jet_energy_resolution_correction"] = jerc_down(
-                length=len(out), form=scalar_form
-            )
-            init_pt_jer = partial(
-                awkward.virtual,
-                operator.mul,
-                args=(
-                    down["jet_energy_resolution_correction"],
-                    out_dict[jer_name_map["JetPt"]],
-                ),
-                cache=lazy_cache,
-            )
-            init_mass_jer = partial(
-                awkward.virtual,
-                operator.mul,
-                args=(
-                    down["jet_energy_resolution_correction"],
-                    out_dict[jer_name_map["JetMass"]],
-                ),
-                cache=lazy_cache,
-            )
-            down[self.name_map["JetPt"]] = init_pt_jer(
-                length=len(out), form=scalar_form
-            )
-            down[self.name_map["JetMass"]] = init_mass_jer(
-                length=len(out), form=scalar_form
-            )
-            out_dict["JER"] = awkward.zip(
-                {"up": up, "down": down}, depth_limit=1, with_name="JetSystematic"
-            )
+                jerc_down = partial(
+                    awkward.virtual,
+                    jer_smear_factor,
+                    args=(2,),
+                    cache=lazy_cache,
+                )
+                down = awkward.flatten(jets)
+                down["jet_energy_resolution_correction"] = jerc_down(
+                    length=len(out), form=scalar_form
+                )
+                init_pt_jer = partial(
+                    awkward.virtual,
+                    operator.mul,
+                    args=(
+                        down["jet_energy_resolution_correction"],
+                        out_dict[jer_name_map["JetPt"]],
+                    ),
+                    cache=lazy_cache,
+                )
+                init_mass_jer = partial(
+                    awkward.virtual,
+                    operator.mul,
+                    args=(
+                        down["jet_energy_resolution_correction"],
+                        out_dict[jer_name_map["JetMass"]],
+                    ),
+                    cache=lazy_cache,
+                )
+                down[self.name_map["JetPt"]] = init_pt_jer(
+                    length=len(out), form=scalar_form
+                )
+                down[self.name_map["JetMass"]] = init_mass_jer(
+                    length=len(out), form=scalar_form
+                )
+                return awkward.zip(
+                    {"up": up, "down": down}, depth_limit=1, with_name="JetSystematic"
+                )
+
+            available_systematics.append("JER")
+            if is_requested("JER"):
+                out_dict["JER"] = awkward.virtual(build_jer_variant, length=len(out), cache={})
 
         # Apply uncertainties (JES)
         has_junc = self.jec_stack.junc is not None
@@ -512,38 +577,30 @@ class CorrectedJetsFactory(object):
                 junc_args = {
                     k: out_dict[junc_name_map[k]] for k in self.jec_stack.junc.signature
                 }
-                juncs = self.jec_stack.junc.getUncertainty(**junc_args)
+                juncs = list(self.jec_stack.junc.getUncertainty(**junc_args))
+                available_systematics.extend(f"JES_{name}" for name, _ in juncs)
+                juncs = [(name, func) for name, func in juncs if is_requested(f"JES_{name}")]
 
             elif self.tool == "clib":
-                junc_out_parms = out.layout.parameters
-                junc_out_parms["corrected"] = True
-                junc_out = awkward.zip(
-                    out_dict, depth_limit=1, parameters=junc_out_parms, behavior=out.behavior
-                )
-                juncjets = wrap(junc_out)
-
-                uncnames, uncvalues = [], []
-                for junc_name in self.jec_stack.jec_uncsources_clib:
+                # Evaluate all of the sources into a single (n_sources x n_jets) block
+                uncsources = self.jec_stack.jec_uncsources_clib
+                uncnames = [junc_name.split("_")[-2] for junc_name in uncsources]
+                available_systematics.extend(f"JES_{name}" for name in uncnames)
+                uncsources = [junc_name for junc_name, name in zip(uncsources, uncnames) if is_requested(f"JES_{name}")]
+                uncnames = [name for name in uncnames if is_requested(f"JES_{name}")]
+                uncblock = numpy.empty((len(uncsources), len(out)), dtype=numpy.float32)
+                for i, junc_name in enumerate(uncsources):
                     sf = self.corrections[junc_name]
                     if sf is None:
                         raise ValueError(f"Correction {junc_name} not found in self.corrections")
 
-                    inputs = get_corr_inputs(jets=juncjets, corr_obj=sf, name_map=junc_name_map)
-                    unc = awkward.values_astype(sf.evaluate(*inputs), numpy.float32)
-                    central = awkward.ones_like(out_dict[self.name_map["JetPt"]])
-                    unc_up = central + unc
-                    unc_down = central - unc
-                    uncnames.append(junc_name.split("_")[-2])
-                    uncvalues.append([unc_up, unc_down])
-                del juncjets
+                    inputs = get_corr_inputs(jets=out_dict, corr_obj=sf, name_map=junc_name_map, column_cache=column_cache)
+                    uncblock[i] = sf.evaluate(*inputs)
 
-                # Combine the up and down values into pairs
-                combined_uncvalues = [
-                    awkward.Array([[up, down] for up, down in zip(unc_up, unc_down)])
-                    for unc_up, unc_down in uncvalues
-                ]
+                # The (n_jets x 2) up/down factors of each source, as 1 +/- unc
+                uncvalues = numpy.stack([_ONE_F32 + uncblock, _ONE_F32 - uncblock], axis=-1)
 
-                juncs = zip(uncnames, combined_uncvalues)
+                juncs = zip(uncnames, (awkward.Array(values) for values in uncvalues))
 
             def junc_smeared_val(uncvals, up_down, variable):
                 return awkward.materialized(uncvals[:, up_down] * variable)
@@ -581,16 +638,26 @@ class CorrectedJetsFactory(object):
 
             for name, func in juncs:
                 out_dict[f"jet_energy_uncertainty_{name}"] = func
-                out_dict[f"JES_{name}"] = build_variant(
-                    func,
-                    self.name_map["JetPt"],
-                    out_dict[junc_name_map["JetPt"]],
-                    self.name_map["JetMass"],
-                    out_dict[junc_name_map["JetMass"]],
+                out_dict[f"JES_{name}"] = awkward.virtual(
+                    build_variant,
+                    args=(
+                        func,
+                        self.name_map["JetPt"],
+                        out_dict[junc_name_map["JetPt"]],
+                        self.name_map["JetMass"],
+                        out_dict[junc_name_map["JetMass"]],
+                    ),
+                    length=len(out),
+                    cache={},
                 )
 
-        out_parms = out.layout.parameters
+        if systematics is not None:
+            missing = set(systematics) - set(available_systematics)
+            if len(missing) > 0:
+                raise ValueError(f"Unknown systematics {sorted(missing)}, the available ones are {available_systematics}")
+
+        out_parms = dict(out.layout.parameters)
         out_parms["corrected"] = True
         out = awkward.zip(out_dict, depth_limit=1, parameters=out_parms, behavior=out.behavior)
 
-        return wrap(out)
+        return rewrap_like(out, jets)
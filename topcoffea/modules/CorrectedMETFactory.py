@@ -1,6 +1,7 @@
 import awkward
 import numpy
 from copy import copy
+from topcoffea.modules.CorrectedJetsFactory import LazyCache
 
 def corrected_polar_met(met_pt, met_phi, jet_pt, jet_phi, jet_pt_orig, deltas=None):
     sj, cj = numpy.sin(jet_phi), numpy.cos(jet_phi)
@@ -16,6 +17,35 @@ def corrected_polar_met(met_pt, met_phi, jet_pt, jet_phi, jet_pt_orig, deltas=No
         y = y + dy if positive else y - dy
     return awkward.zip({"pt": numpy.hypot(x, y), "phi": numpy.arctan2(y, x)})
 
+def segmented_sum(values, counts):
+    """Sums of the consecutive segments of lengths counts along the last axis of values"""
+    out = numpy.zeros(values.shape[:-1] + (len(counts),), dtype=values.dtype)
+    nonempty = counts > 0
+    if numpy.any(nonempty):
+        starts = numpy.cumsum(counts) - counts
+        out[..., nonempty] = numpy.add.reduceat(values, starts[nonempty], axis=-1)
+    return out
+
+def corrected_polar_met_batch(met_pt, met_phi, jet_cos, jet_sin, counts, jet_pt_deltas, met_deltas=None):
+    """
+    Corrected MET of several variations together, from the flat cos/sin of the jet phis (computed once)
+    and the stacked (n_variations x n_jets) corrected - raw jet pts, with a single segmented sum over the jets.
+    If met_deltas, the (dx, dy) of the unclustered energy, are given, the up and down variations of the first
+    row are appended after the variations of the jets.
+    Returns a dictionary with the (n_variations x n_events) pt and phi.
+    """
+    sums = segmented_sum(numpy.concatenate([jet_pt_deltas * jet_cos, jet_pt_deltas * jet_sin]), counts)
+    x = met_pt * numpy.cos(met_phi) + sums[:len(jet_pt_deltas)]
+    y = met_pt * numpy.sin(met_phi) + sums[len(jet_pt_deltas):]
+    if met_deltas is not None:
+        dx, dy = met_deltas
+        x = numpy.concatenate([x, x[:1] + dx, x[:1] - dx])
+        y = numpy.concatenate([y, y[:1] + dy, y[:1] - dy])
+    return {
+        "pt": numpy.hypot(x, y).astype(met_pt.dtype, copy=False),
+        "phi": numpy.arctan2(y, x).astype(met_phi.dtype, copy=False),
+    }
+
 class CorrectedMETFactory(object):
     def __init__(self, name_map):
         for name in [
@@ -39,7 +69,7 @@ class CorrectedMETFactory(object):
             raise Exception(
                 "CorrectedMETFactory requires a awkward-array cache to function correctly."
             )
-        lazy_cache = awkward._util.MappingProxy.maybe_wrap(lazy_cache)
+        lazy_cache = LazyCache.maybe_wrap(lazy_cache)
         if not isinstance(MET, awkward.highlevel.Array) or not isinstance(
             corrected_jets, awkward.highlevel.Array
         ):
@@ -48,65 +78,77 @@ class CorrectedMETFactory(object):
             )
 
         length = len(MET)
-        form = awkward.forms.RecordForm(
-            {
-                "pt": MET[self.name_map["METpt"]].layout.form,
-                "phi": MET[self.name_map["METphi"]].layout.form,
-            },
-        )
+        pt_form = MET[self.name_map["METpt"]].layout.form
+        phi_form = MET[self.name_map["METphi"]].layout.form
+
+        uncertainties = [unc for unc in awkward.fields(corrected_jets) if unc.startswith(("JER", "JES"))]
+
+        # The variations are computed in batches, when one of their columns is first accessed:
+        # the nominal MET with the unclustered energy variations, and the up/down pair of each JER/JES
+        # uncertainty (so that only the jet variations that are used get built).
+        # The cos/sin of the jet phis are shared by all of the batches.
+        batches = {}
+        jet_trig = []
+
+        def get_jet_trig():
+            if len(jet_trig) == 0:
+                jet_phi = awkward.to_numpy(awkward.flatten(corrected_jets[self.name_map["JetPhi"]]))
+                counts = awkward.to_numpy(awkward.num(corrected_jets[self.name_map["JetPhi"]], axis=1))
+                jet_trig.extend([numpy.cos(jet_phi), numpy.sin(jet_phi), counts])
+            return jet_trig
 
-        def make_variant(*args):
+        def jet_pt_delta(jets):
+            return awkward.to_numpy(awkward.flatten(jets[self.name_map["JetPt"]] - jets[self.name_map["ptRaw"]]))
+
+        def get_batch(name):
+            if name not in batches:
+                met_pt = awkward.to_numpy(MET[self.name_map["METpt"]])
+                met_phi = awkward.to_numpy(MET[self.name_map["METphi"]])
+                if name == "nominal":
+                    jet_pt_deltas = jet_pt_delta(corrected_jets)[numpy.newaxis]
+                    met_deltas = numpy.stack([
+                        awkward.to_numpy(MET[self.name_map["UnClusteredEnergyDeltaX"]]),
+                        awkward.to_numpy(MET[self.name_map["UnClusteredEnergyDeltaY"]]),
+                    ])
+                else:
+                    # Rows: the up and down variations of the uncertainty
+                    jet_pt_deltas = numpy.stack([jet_pt_delta(corrected_jets[name][updown]) for updown in ["up", "down"]])
+                    met_deltas = None
+                batches[name] = corrected_polar_met_batch(met_pt, met_phi, *get_jet_trig(), jet_pt_deltas, met_deltas)
+            return batches[name]
+
+        def met_column(name, index, field):
+            return awkward.Array(get_batch(name)[field][index])
+
+        def make_variant(name, index):
             variant = copy(MET)
-            corrected_met = awkward.virtual(
-                corrected_polar_met,
-                args=args,
-                length=length,
-                form=form,
-                cache=lazy_cache,
-            )
             variant[self.name_map["METpt"]] = awkward.virtual(
-                lambda: awkward.materialized(corrected_met.pt),
+                met_column,
+                args=(name, index, "pt"),
                 length=length,
-                form=form.contents["pt"],
+                form=pt_form,
                 cache=lazy_cache,
             )
             variant[self.name_map["METphi"]] = awkward.virtual(
-                lambda: awkward.materialized(corrected_met.phi),
+                met_column,
+                args=(name, index, "phi"),
                 length=length,
-                form=form.contents["phi"],
+                form=phi_form,
                 cache=lazy_cache,
             )
             return variant
 
-        def lazy_variant(unc, metpt, metphi, jetpt, jetphi, jetptraw):
+        def lazy_variant(unc):
             return awkward.zip(
                 {
-                    "up": make_variant(
-                        MET[metpt],
-                        MET[metphi],
-                        corrected_jets[unc].up[jetpt],
-                        corrected_jets[unc].up[jetphi],
-                        corrected_jets[unc].up[jetptraw],
-                    ),
-                    "down": make_variant(
-                        MET[metpt],
-                        MET[metphi],
-                        corrected_jets[unc].down[jetpt],
-                        corrected_jets[unc].down[jetphi],
-                        corrected_jets[unc].down[jetptraw],
-                    ),
+                    "up": make_variant(unc, 0),
+                    "down": make_variant(unc, 1),
                 },
                 depth_limit=1,
                 with_name="METSystematic",
             )
 
-        out = make_variant(
-            MET[self.name_map["METpt"]],
-            MET[self.name_map["METphi"]],
-            corrected_jets[self.name_map["JetPt"]],
-            corrected_jets[self.name_map["JetPhi"]],
-            corrected_jets[self.name_map["ptRaw"]],
-        )
+        out = make_variant("nominal", 0)
         out[self.name_map["METpt"] + "_orig"] = MET[self.name_map["METpt"]]
         out[self.name_map["METphi"] + "_orig"] = MET[self.name_map["METphi"]]
 
@@ -114,53 +156,22 @@ class CorrectedMETFactory(object):
 
         out_dict["MET_UnclusteredEnergy"] = awkward.zip(
             {
-                "up": make_variant(
-                    MET[self.name_map["METpt"]],
-                    MET[self.name_map["METphi"]],
-                    corrected_jets[self.name_map["JetPt"]],
-                    corrected_jets[self.name_map["JetPhi"]],
-                    corrected_jets[self.name_map["ptRaw"]],
-                    (
-                        True,
-                        MET[self.name_map["UnClusteredEnergyDeltaX"]],
-                        MET[self.name_map["UnClusteredEnergyDeltaY"]],
-                    ),
-                ),
-                "down": make_variant(
-                    MET[self.name_map["METpt"]],
-                    MET[self.name_map["METphi"]],
-                    corrected_jets[self.name_map["JetPt"]],
-                    corrected_jets[self.name_map["JetPhi"]],
-                    corrected_jets[self.name_map["ptRaw"]],
-                    (
-                        False,
-                        MET[self.name_map["UnClusteredEnergyDeltaX"]],
-                        MET[self.name_map["UnClusteredEnergyDeltaY"]],
-                    ),
-                ),
+                "up": make_variant("nominal", 1),
+                "down": make_variant("nominal", 2),
             },
             depth_limit=1,
             with_name="METSystematic",
         )
 
-        for unc in filter(
-            lambda x: x.startswith(("JER", "JES")), awkward.fields(corrected_jets)
-        ):
+        for unc in uncertainties:
             out_dict[unc] = awkward.virtual(
                 lazy_variant,
-                args=(
-                    unc,
-                    self.name_map["METpt"],
-                    self.name_map["METphi"],
-                    self.name_map["JetPt"],
-                    self.name_map["JetPhi"],
-                    self.name_map["ptRaw"],
-                ),
+                args=(unc,),
                 length=length,
                 cache={},
             )
 
-        out_parms = out.layout.parameters
+        out_parms = dict(out.layout.parameters)
         out = awkward.zip(
             out_dict, depth_limit=1, parameters=out_parms, behavior=out.behavior
         )
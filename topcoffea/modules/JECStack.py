@@ -4,7 +4,7 @@ from coffea.jetmet_tools.FactorizedJetCorrector import FactorizedJetCorrector, _
 from coffea.jetmet_tools.JetResolution import JetResolution
 from coffea.jetmet_tools.JetResolutionScaleFactor import JetResolutionScaleFactor
 from coffea.jetmet_tools.JetCorrectionUncertainty import JetCorrectionUncertainty
-import correctionlib as clib
+from topcoffea.modules.correction_cache import load_correction_set
 
 @dataclass
 class JECStack:
@@ -41,8 +41,8 @@ class JECStack:
         if not self.json_path:
             raise ValueError("json_path is required for clib initialization.")
 
-        # Load corrections directly from the JSON path
-        self.cset = clib.CorrectionSet.from_file(self.json_path)
+        # Load corrections from the JSON path (the parsed CorrectionSet is shared within the process)
+        self.cset = load_correction_set(self.json_path)
 
         # Construct lists for jec, jer, and uncertainties
         self.jec_names_clib = [f"{self.jec_tag}_{level}_{self.jet_algo}" for level in self.jec_levels]
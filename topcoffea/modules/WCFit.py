@@ -3,14 +3,52 @@
  This is basically a python copy of the c++ WCFit class
    (see: https://github.com/TopEFT/EFTGenReader)
  Per-event fits of WC points are done with numpy.lstsq
+ The pairs and coefficients are stored as numpy arrays, so that the design matrix of a fit,
+ the evaluation at (a batch of) WC points and the arithmetic between fits are all vectorized
 """
 
 import numpy as np
-from numpy import sqrt
-from topcoffea.modules.WCPoint import WCPoint
+from topcoffea.modules.WCPoint import WCPoint, WCPointSet
 
 kSMstr = 'sm' # For global use
 
+def LowerTrianglePairs(n):
+  """ Returns the (ordered) index pairs of the lower triangle of a n x n matrix, i.e. the
+      (0,0) (1,0) (1,1) (2,0) (2,1) (2,2) ... convention used for both the pairs and err_pairs """
+  return np.column_stack(np.tril_indices(n)).astype(np.intp)
+
+def QuadraticTerms(x, pairs):
+  """ Returns the design matrix of the quadratic function, i.e. x[:,p[0]]*x[:,p[1]] for every pair
+      x is a (n_points x n_names) array of WC strengths (with 1 in the place of the 'sm' term) """
+  return x[:, pairs[:, 0]] * x[:, pairs[:, 1]]
+
+def FitEventWeights(wgts, pts, names=None, chunk_size=100000):
+  """ Extract the per-event quadratic fits from a (n_events x n_points) matrix of reweighting weights
+      The WC points are the same for all events, so the design matrix is factored once (pseudo-inverse)
+      and the fits of all the events are obtained with a matmul, streaming over chunks of events
+        pts: A WCPointSet, a list of WCPoints, or an array of shape (n_points, n_wc) in which case names must be given
+        Returns the (n_events x n_terms) array of coefficients, ordered as the pairs of a WCFit with names ['sm'] + names """
+  wgts = np.asarray(wgts, dtype=float)
+  if wgts.ndim != 2:
+    raise ValueError(f"The weights must be a (n_events x n_points) array, got an array of shape {wgts.shape}")
+  if names is None:
+    # This assumes that all WCPoints have exact same list of WC names
+    names = pts.GetNames() if isinstance(pts, WCPointSet) else list(pts[0].inputs.keys())
+  fit = WCFit()
+  fit.SetNames([kSMstr] + list(names))
+  x, _ = fit.GetStrengths(pts if isinstance(pts, (list, tuple, WCPointSet)) else np.asarray(pts, dtype=float))
+  A = QuadraticTerms(x, fit.pairs)
+  if wgts.shape[-1] != len(A):
+    raise ValueError(f"The weights are given for {wgts.shape[-1]} points, but {len(A)} WC points were given")
+
+  # Same (minimum norm) least squares solution as np.linalg.lstsq, for every event at once
+  solver = np.linalg.pinv(A).T
+  out = np.empty((len(wgts), fit.Size()))
+  for start in range(0, len(wgts), chunk_size):
+    stop = min(start + chunk_size, len(wgts))
+    np.matmul(wgts[start:stop], solver, out=out[start:stop])
+  return out
+
 class WCFit:
 
   def SetTag(self, tag):
@@ -53,47 +91,19 @@ class WCFit:
 
   def GetIndexPair(self, n1, n2=''):
     """ Returns a (ordered) pair of indicies corresponding to a particular quadratic term
-        Convention note: idx1 <= idx2 always! """
-    if len(n1) == 2: n1,n2 = n1 
-    idx1, idx2, which = -1, -1, -1
-    for i in range(len(self.names)):
-      if   which == -1 and n1 == self.names[i]:
-        idx1 = i
-        which = 1
-      elif which == -1 and n2 == self.names[i]:
-        idx1 = i
-        which = 2
-      if idx1 == -1: #We haven't found the first index yet!
-        continue;
-      if   which == 1 and n2 == self.names[i]:
-        idx2 = i
-        break
-      elif which == 2 and n1 == self.names[i]:
-        idx2 = i
-        break
-    return idx2, idx1
+        Convention note: idx1 >= idx2 always! """
+    if not isinstance(n1, str) and len(n1) == 2: n1,n2 = n1
+    idx1 = self.name_idx.get(n1, -1)
+    idx2 = self.name_idx.get(n2, -1)
+    if idx1 == -1 or idx2 == -1: return -1, -1
+    return max(idx1, idx2), min(idx1, idx2)
 
   def GetCoefficient(self, n1, n2=''):
-    """ Returns a particular structure constant from the fit function
-        Note: This is a very brute force method of finding the corresponding coefficient,
-        the overloaded function method should be used whenever possible """
-    if isinstance(n1,int): return self.coeffs[n1]
-    id1, id2 = self.GetIndexPair(n1, n2)
-    if id1 == -1 or id2 == -1: return 0. # We don't have the fit parameter pair, assume 0 (i.e. SM value)
-    print('ncoeffs = ', len(self.coeffs))
-    print('npairs = ', len(self.pairs))
-    print('pairs = ', self.pairs)
-
-    if len(self.pairs) != len(self.coeffs):
-      print('[ERROR] WCFit pairs and coeffs vectors dont match! (getCoefficient)')
-      return 0.0;
-
-    for i in range(self.Size()):
-      if self.pairs[i][0] == id1 and self.pairs[i][1] == id2:
-        return self.coeffs[i]
-
-    print("[ERROR] WCFit unable to find WC pair! (getCoefficient)")
-    return 0.
+    """ Returns a particular structure constant from the fit function, either from its index or from the WC names of the term """
+    if isinstance(n1,(int,np.integer)): return self.coeffs[n1]
+    idx_pair = self.GetIndexPair(n1, n2)
+    if idx_pair not in self.pair_idx: return 0. # We don't have the fit parameter pair, assume 0 (i.e. SM value)
+    return self.coeffs[self.pair_idx[idx_pair]]
 
   def GetErrorCoefficient(self, idx):
     """ Can only access the error coefficients directly via the err_coeffs vector """
@@ -105,45 +115,58 @@ class WCFit:
 
   def HasCoefficient(self, wc_name):
     """ Checks to see if the fit includes the specified WC """
-    return wc_name in self.names
+    return wc_name in self.name_idx
+
+  def GetStrengths(self, pt, val=0.0):
+    """ Returns a (n_points x n_names) array with the WC strengths of the point(s), where the 'sm' column is always 1
+        The point(s) can be given as:
+          - A WCPoint, or a WC name together with its value(s)
+          - A dictionary {wc_name: value(s)}, the values can be arrays in order to specify a batch of points
+          - A list of WCPoints, or a WCPointSet
+          - An array of shape (n_wc,) or (n_points, n_wc), with the WCs ordered as in GetNames()[1:]
+        Also returns whether a single point was given """
+    single = True
+    if isinstance(pt, WCPoint):
+      vals = pt.inputs
+    elif isinstance(pt, str):
+      vals = {pt: val}
+      single = (np.ndim(val) == 0)
+    elif isinstance(pt, dict):
+      vals = pt
+      single = all(np.ndim(v) == 0 for v in vals.values())
+    elif isinstance(pt, WCPointSet):
+      vals = {n: pt.GetStrength(n) for n in self.names}
+      single = False
+    elif isinstance(pt, (list, tuple)) and len(pt) > 0 and isinstance(pt[0], WCPoint):
+      vals = {n: [p.GetStrength(n) for p in pt] for n in self.names}
+      single = False
+    else:
+      arr = np.asarray(pt, dtype=float)
+      single = (arr.ndim == 1)
+      wc_names = [n for n in self.names if n != kSMstr]
+      if arr.shape[-1] != len(wc_names):
+        raise ValueError(f"Expected {len(wc_names)} WC values per point, received {arr.shape[-1]}")
+      vals = dict(zip(wc_names, np.atleast_2d(arr).T))
+    if len(self.names) == 0: return np.zeros((1,0)), single
+    cols = [np.ones(1) if n == kSMstr else np.atleast_1d(np.asarray(vals.get(n, 0.0), dtype=float)) for n in self.names]
+    x = np.column_stack(np.broadcast_arrays(*cols))
+    return x, single
 
   def EvalPoint(self, pt, val=0.0):
-    """ Evaluate the fit at a particular WC phase space point """
-    if not isinstance(pt, WCPoint):
-      wc_name = pt
-      pt = WCPoint()
-      pt.SetStrength(wc_name, val)
-    v = 0
-    for i in range(self.Size()):
-      c = self.coeffs[i]
-      n1 = self.names[(self.pairs[i])[0]]
-      n2 = self.names[(self.pairs[i])[1]]
-      x1 = 1 if n1 == kSMstr else pt.GetStrength(n1)
-      x2 = 1 if n2 == kSMstr else pt.GetStrength(n2)
-      v += x1*x2*c;
-    return v;
+    """ Evaluate the fit at a particular WC phase space point, or at a batch of points (see GetStrengths) """
+    x, single = self.GetStrengths(pt, val)
+    v = QuadraticTerms(x, self.pairs) @ self.coeffs
+    return float(v[0]) if single else v
 
   def EvalPointError(self, pt, val = 0.0):
-    """ Evaluate the error fit at a particular WC phase space point """
-    if not isinstance(pt, WCPoint):
-      wc_name = pt
-      pt = WCPoint()
-      pt.SetStrength(wc_name, val)
-    i = 0
-    v,x1,x2,x3,x4,c = 0., 0., 0., 0., 0., 0.
-    n1,n2,n3,n4 = '', '', '', ''
-    err_pair,idx_pair = (0.,0.),(0.,0.)
-    for i in range(self.ErrSize()):
-      c = self.err_coeffs[i]
-      err_pair = self.err_pairs[i]
-      idx_pair = self.pairs[err_pair[0]]; n1 = self.names[idx_pair[0]]; n2 = self.names[idx_pair[1]]
-      idx_pair = self.pairs[err_pair[1]]; n3 = self.names[idx_pair[0]]; n4 = self.names[idx_pair[1]]
-      x1 = 1.0 if n1 == kSMstr else pt.GetStrength(n1)
-      x2 = 1.0 if n2 == kSMstr else pt.GetStrength(n2)
-      x3 = 1.0 if n3 == kSMstr else pt.GetStrength(n3)
-      x4 = 1.0 if n4 == kSMstr else pt.GetStrength(n4)
-      v += x1*x2*x3*x4*c;
-    return sqrt(v);
+    """ Evaluate the error fit at a particular WC phase space point, or at a batch of points (see GetStrengths) """
+    x, single = self.GetStrengths(pt, val)
+    terms = QuadraticTerms(x, self.pairs)
+    # The error fit is a quadratic function of the terms of the fit itself
+    err_mat = np.zeros((self.Size(), self.Size()))
+    err_mat[self.err_pairs[:, 0], self.err_pairs[:, 1]] = self.err_coeffs
+    v = np.sqrt(np.sum((terms @ err_mat) * terms, axis=1))
+    return float(v[0]) if single else v
 
   def AddFit(self, added_fit):
     """ Add fit """
@@ -155,6 +178,7 @@ class WCFit:
       self.coeffs     = added_fit.GetCoefficients().copy()
       self.err_pairs  = added_fit.GetErrorPairs().copy()
       self.err_coeffs = added_fit.GetErrorCoefficients().copy()
+      self.UpdateLookupTables()
       if len(self.tag) == 0: self.tag = added_fit.GetTag()
       return;
 
@@ -165,22 +189,22 @@ class WCFit:
       print("[ERROR] WCFit mismatch in error pairs! (addFit)")
       return
 
-    for i in range(self.ErrSize()):
-      if i < self.Size(): self.coeffs[i] += added_fit.GetCoefficient(i)
-      # It is *very* important that we keep track of the err fit coeffs separately, since Sum(f^2) != (Sum(f))^2
-      self.err_coeffs[i] += added_fit.GetErrorCoefficient(i)
+    self.coeffs += added_fit.GetCoefficients()
+    # It is *very* important that we keep track of the err fit coeffs separately, since Sum(f^2) != (Sum(f))^2
+    self.err_coeffs += added_fit.GetErrorCoefficients()
 
   def Scale(self, val):
     """ Scaling fit """
-    for i in range(self.Size()):    self.coeffs[i]     *= val
-    for i in range(self.ErrSize()): self.err_coeffs[i] += val*val
+    self.coeffs *= val
+    self.err_coeffs *= val*val
 
   def Clear(self):
-    self.names.clear()
-    self.pairs.clear()
-    self.coeffs.clear()
-    self.err_pairs.clear()
-    self.err_coeffs.clear()
+    self.names = []
+    self.pairs = LowerTrianglePairs(0)
+    self.coeffs = np.zeros(0)
+    self.err_pairs = LowerTrianglePairs(0)
+    self.err_coeffs = np.zeros(0)
+    self.UpdateLookupTables()
 
   def Serialize(self):
     """ Serialize WCFit {coeffs: numbers} and {err_coeffs: numbers} to JSON """
@@ -202,9 +226,8 @@ class WCFit:
       key = '*'.join([n1,n2,n3,n4])
       derr.setdefault(key, []).append(self.err_coeffs[i])
     '''
-    lnames = [(i,j) for i in self.names for j in self.names]
-    dcoeff = [[p, self.coeffs[self.pairs.index(p)]] for p in self.pairs]
-    derr = [[p, self.err_coeffs[self.err_pairs.index(p)]] for p in self.err_pairs]
+    dcoeff = [[tuple(p), c] for p,c in zip(self.pairs.tolist(), self.coeffs.tolist())]
+    derr = [[tuple(p), c] for p,c in zip(self.err_pairs.tolist(), self.err_coeffs.tolist())]
     #f = open('serial.json','a')
     #f.write(self.GetTag()+'\n')
     d = {'tag': self.GetTag(),\
@@ -313,85 +336,83 @@ class WCFit:
       print('[ERROR] Tried to extend WCFit with a name already present! (extend)')
       return;
 
-    self.names.append(newName)
-    new_idx1 = len(self.names)-1
-    # Extend the pairs and coeffs vectors
-    for i in range(new_idx1+1):
-      idx_pair1 = (new_idx1, i)
-      self.pairs.append(idx_pair1)
-      self.coeffs.append(0.0) # Extending makes no assumptions about the fit coefficients
-      # Extend the err_pairs and err_coeffs vectors
-      new_idx2 = len(self.pairs)-1
-      for j in range(new_idx2+1):
-        idx_pair2 = (new_idx2,j)
-        self.err_pairs.append(idx_pair2)
-        self.err_coeffs.append(0.0)
+    self.SetNames(self.names + [newName])
+
+  def SetNames(self, names):
+    """ Builds the pairs and err_pairs for a given list of names in one go (see Extend for the conventions)
+        The current names must be a prefix of the new list (call Clear first to replace them):
+        the coefficients of the terms already present are kept, the new ones are set to 0 """
+    names = list(names)
+    if names[:len(self.names)] != self.names:
+      raise ValueError(f"The current names {self.names} must be a prefix of the new names {names}, use Clear() to replace them")
+    self.names = names
+    self.pairs = LowerTrianglePairs(len(self.names))
+    self.err_pairs = LowerTrianglePairs(len(self.pairs))
+    # Extending makes no assumptions about the fit coefficients
+    self.coeffs = np.concatenate([self.coeffs, np.zeros(self.Size() - len(self.coeffs))])
+    self.err_coeffs = np.concatenate([self.err_coeffs, np.zeros(self.ErrSize() - len(self.err_coeffs))])
+    self.UpdateLookupTables()
+
+  def UpdateLookupTables(self):
+    """ Build the name -> index and (idx1,idx2) pair -> term index look up tables """
+    self.name_idx = {n: i for i,n in enumerate(self.names)}
+    self.pair_idx = {p: i for i,p in enumerate(map(tuple, self.pairs.tolist()))}
+
+  def ErrorCoefficientsFromFit(self, coeffs):
+    """ Returns the err_coeffs corresponding to the square of a fit with the given coefficients """
+    e0, e1 = self.err_pairs[:, 0], self.err_pairs[:, 1]
+    return np.where(e0 == e1, 1., 2.) * coeffs[..., e0] * coeffs[..., e1]
 
   def FitPoints(self,pts):
-    """ Extract a n-Dim quadratic fit from a collection of WC phase space points """
+    """ Extract a n-Dim quadratic fit from a collection of WC phase space points (list of WCPoints or WCPointSet) """
     self.Clear()
     if len(pts) == 0: return
 
-    self.Extend(kSMstr) # The SM term is always first
+    # The SM term is always first
+    if isinstance(pts, WCPointSet):
+      self.SetNames([kSMstr] + pts.GetNames())
+      b = pts.GetWeights()
+    else:
+      # This assumes that all WCPoints have exact same list of WC names
+      self.SetNames([kSMstr] + list(pts[0].inputs.keys()))
+      pts = list(pts)
+      b = np.array([pt.wgt for pt in pts], dtype=float)
 
-    # This assumes that all WCPoints have exact same list of WC names
-    for kv in pts[0].inputs.keys(): 
-      self.Extend(kv)
-
-    nCols = self.Size() # Should be equal to 1 + 2*N + N*(N - 1)/2
-    nRows = len(pts)
-
-    A = []; b = []
-    for rid in range(nRows):
-      A.append([])
-      for cid in range(nCols):
-        idx_pair = self.pairs[cid]
-        n1 = self.names[idx_pair[0]]
-        n2 = self.names[idx_pair[1]]
-        x1 = 1. if n1 == kSMstr else pts[rid].inputs[n1]
-        x2 = 1. if n2 == kSMstr else pts[rid].inputs[n2]
-        A[rid].append(x1*x2)
-      b.append(pts[rid].wgt)
-    A = np.array(A)
-    b = np.array(b)
+    x, _ = self.GetStrengths(pts)
+    A = QuadraticTerms(x, self.pairs) # Should have 1 + 2*N + N*(N - 1)/2 columns
 
     c_x, _, _, _ = np.linalg.lstsq(A,b, rcond=None) # Solve for the fit parameters
-    for i in range(self.ErrSize()):
-      if i < self.Size(): self.coeffs[i] = c_x[i]
-      idx_pair = self.err_pairs[i]
-      self.err_coeffs[i] = c_x[idx_pair[0]]*c_x[idx_pair[1]] if idx_pair[0] == idx_pair[1] else 2*c_x[idx_pair[0]]*c_x[idx_pair[1]]
+    self.coeffs = c_x
+    self.err_coeffs = self.ErrorCoefficientsFromFit(c_x)
 
   def SetNamesAndCoefficients(self, names, coefficients, errors=[]):
     self.Clear()
     if len(names) == 0: return
-    self.Extend(kSMstr)
+    self.SetNames([kSMstr] + list(names))
 
-    for name in names: self.Extend(name)
     if self.Size() != len(coefficients):
       print('ERROR : %i coefficients are needed but %i are given'%(self.Size(), len(coefficients)))
       return
- 
-    for i in range(self.Size()):
-      self.coeffs[i] = coefficients[i]
 
-    if len(errors) == self.ErrSize():
-      for i in range(self.ErrSize()):
-        self.err_coeffs[i] = errors[i]
+    self.coeffs = np.array(coefficients, dtype=float)
+
+    if errors is not None and len(errors) == self.ErrSize():
+      self.err_coeffs = np.array(errors, dtype=float)
     else:
-      for i in range(self.ErrSize()):
-        idx_pair = self.err_pairs[i]
-        self.err_coeffs[i] = coefficients[idx_pair[0]]*coefficients[idx_pair[1]] if idx_pair[0] == idx_pair[1] else 2*coefficients[idx_pair[0]]*coefficients[idx_pair[1]]
+      self.err_coeffs = self.ErrorCoefficientsFromFit(self.coeffs)
 
   def __init__(self, wcpoints=None, tag='', names=None, coeffs=None, errors=None):
     """ Constructor """
     self.names = [] # Includes 'sm'
-    self.pairs = [] # pair doublets of the 'names' list
-    self.coeffs = [] # fit structure constants
-    self.err_pairs = [] # pair doubles, indices of the 'pairs' list
-    self.err_coeffs = [] # The error fit structure constants
+    self.pairs = LowerTrianglePairs(0) # (n x 2) array, pair doublets of the 'names' list
+    self.coeffs = np.zeros(0) # fit structure constants
+    self.err_pairs = LowerTrianglePairs(0) # (n x 2) array, pair doubles, indices of the 'pairs' list
+    self.err_coeffs = np.zeros(0) # The error fit structure constants
+    self.name_idx = {} # Look up table of the 'names' list
+    self.pair_idx = {} # Look up table of the 'pairs' list
     self.tag = ''
     self.tag = tag
-    if wcpoints != None:
+    if wcpoints is not None:
       self.FitPoints(wcpoints)
     if not coeffs is None:
       n = len(names)
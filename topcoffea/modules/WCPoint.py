@@ -5,6 +5,7 @@
 """
 
 from math import sqrt
+import numpy as np
 
 class WCPoint:
 
@@ -101,3 +102,111 @@ class WCPoint:
       for n,v in zip(names, values):
         self.inputs[n] = v
     self.wgt = float(wgt)
+
+
+class WCPointSet:
+  """ A collection of WC points stored as structure-of-arrays: the WC names are stored once,
+      the strengths in a (n_points x n_wc) array and the weights in a n_points vector """
+
+  kRwgtPrefix = 'EFTrwgt'
+
+  def __init__(self, values=None, names=None, wgts=None, idnums=None):
+    """ Constructor """
+    self.names = [] if names is None else list(names)
+    if values is None:
+      values = np.zeros((0, len(self.names)))
+    self.values = np.atleast_2d(np.asarray(values, dtype=float))
+    if self.values.shape[1] != len(self.names):
+      raise ValueError(f"WCPointSet: got {len(self.names)} WC names but {self.values.shape[1]} values per point")
+    self.wgts = np.zeros(len(self.values)) if wgts is None else np.asarray(wgts, dtype=float).copy()
+    self.idnums = np.zeros(len(self.values), dtype=int) if idnums is None else np.asarray(idnums, dtype=int)
+
+  @classmethod
+  def FromWCPoints(cls, pts):
+    """ Build the set from a list of WCPoint objects (the names are taken from the first point) """
+    names = list(pts[0].inputs.keys()) if len(pts) else []
+    values = [[pt.GetStrength(n) for n in names] for pt in pts]
+    return cls(np.reshape(values, (len(pts), len(names))), names, [pt.wgt for pt in pts], [pt.idnum for pt in pts])
+
+  @classmethod
+  def FromRwgtIds(cls, ids, wgts=None):
+    """ Parse many weight strings (e.g. 'EFTrwgt12_ctG_1.5_ctW_-0.5') at once
+        All of the strings are split in one go, as long as they share the same list of WC names """
+    ids = np.asarray(ids, dtype=str)
+    if ids.size == 0: return cls(wgts=wgts)
+    n_seps = np.char.count(ids, '_')
+    has_prefix = np.char.startswith(ids, cls.kRwgtPrefix)
+    if np.all(n_seps == n_seps[0]) and (np.all(has_prefix) or not np.any(has_prefix)):
+      offset = 1 if has_prefix[0] else 0
+      tokens = np.array('_'.join(ids).split('_')).reshape(len(ids), n_seps[0]+1)
+      names = tokens[0, offset::2]
+      if np.all(tokens[:, offset::2] == names):
+        idnums = np.char.replace(tokens[:, 0], cls.kRwgtPrefix, '').astype(int) if offset else None
+        return cls(tokens[:, offset+1::2].astype(float), names.tolist(), wgts, idnums)
+    # Fallback for a heterogeneous list of strings
+    pts = [WCPoint(s) for s in ids.tolist()]
+    out = cls.FromWCPoints(pts)
+    if wgts is not None: out.wgts = np.asarray(wgts, dtype=float).copy()
+    return out
+
+  def __len__(self):
+    return len(self.values)
+
+  def __getitem__(self, idx):
+    """ Returns the idx-th point as a WCPoint """
+    pt = WCPoint(dict(zip(self.names, self.values[idx].tolist())), self.wgts[idx])
+    pt.idnum = int(self.idnums[idx])
+    return pt
+
+  def GetNames(self):
+    """ Returns the list of WC names, ordered as the columns of the values array """
+    return self.names
+
+  def GetValues(self):
+    """ Returns the (n_points x n_wc) array of WC strengths """
+    return self.values
+
+  def GetWeights(self):
+    """ Returns the weight of each point """
+    return self.wgts
+
+  def Scale(self, _val):
+    """ Scale the weights """
+    self.wgts *= _val
+
+  def HasWC(self, wc_name):
+    """ Returns if the points have an entry for a particular WC """
+    return wc_name in self.names
+
+  def GetStrength(self, wcName):
+    """ Get the strengths of all the points for a particular WC """
+    if wcName not in self.names: return np.zeros(len(self))
+    return self.values[:, self.names.index(wcName)]
+
+  def ToArray(self, pt):
+    """ Get the values of a WCPoint (or dict), ordered as the columns of the set """
+    if isinstance(pt, WCPoint): pt = pt.inputs
+    if isinstance(pt, dict): return np.array([pt.get(n, 0.0) for n in self.names], dtype=float)
+    return np.asarray(pt, dtype=float)
+
+  def GetEuclideanDistance(self, pt=None):
+    """ Calculates the distance of every point from the origin (SM point), or from another point """
+    diff = self.values if pt is None else self.values - self.ToArray(pt)
+    return np.sqrt(np.sum(diff*diff, axis=-1))
+
+  def GetDim(self):
+    """ Returns the number of WC whose strength is non-zero, for every point """
+    return np.count_nonzero(self.values, axis=1)
+
+  def IsSMPoint(self):
+    """ Checks which points are equal to the SM (i.e. 0 for all WC) """
+    return self.GetDim() == 0
+
+  def IsEqualTo(self, pt):
+    """ Compares every point of the set with a given point """
+    return np.all(self.values == self.ToArray(pt), axis=-1)
+
+  def FindPoint(self, pt):
+    """ Returns the index of the first point equal to the given point, or -1 if there is none """
+    idx = np.flatnonzero(self.IsEqualTo(pt))
+    return int(idx[0]) if len(idx) else -1
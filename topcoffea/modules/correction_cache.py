@@ -0,0 +1,118 @@
+"""Process-wide cache of parsed correctionlib CorrectionSets
+
+Decompressing and parsing the POG json files is much more expensive than evaluating the
+corrections, so every loader in topcoffea goes through load_correction_set() and reuses
+the CorrectionSet as long as the file on disk has not changed.
+
+If the on-disk cache is enabled (see disk_cache), the gzipped json files are also
+decompressed once into the cache directory, keyed by the hash of their content, and
+later loads (e.g. on other workers sharing the same scratch area) read the plain json.
+"""
+
+import os
+import gzip
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+
+import correctionlib
+
+from topcoffea.modules.paths import topcoffea_path
+import topcoffea.modules.disk_cache as disk_cache
+
+_hash_cache = {}
+
+
+def content_hash(path):
+    """sha256 of the content of a file (memoized for a given path and mtime)"""
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key not in _hash_cache:
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+        _hash_cache[key] = h.hexdigest()
+    return _hash_cache[key]
+
+
+def decompressed_path(path):
+    """Returns the path of the uncompressed copy of a json.gz file in the cache, creating it if needed
+    Returns the original path if the file is not compressed or if the cache is not enabled"""
+    if not path.endswith(".gz"):
+        return path
+    cache_dir = disk_cache.get_cache_dir("clib")
+    if cache_dir is None:
+        return path
+    name = os.path.basename(path)[:-len(".gz")]
+    cached = os.path.join(cache_dir, f"{content_hash(path)[:16]}_{name}")
+    if not os.path.exists(cached):
+        try:
+            with gzip.open(path, "rb") as fin:
+                disk_cache.atomic_write(cached, lambda fout: shutil.copyfileobj(fin, fout), suffix=".json")
+        except OSError:
+            return path
+    return cached
+
+
+def open_json(path):
+    """Open a (possibly gzipped) json file for reading, using the decompressed copy in the cache if there is one"""
+    path = decompressed_path(path)
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt")
+    return open(path)
+
+
+class CorrectionSetCache:
+    """Thread-safe LRU cache of CorrectionSets, keyed by (path, mtime) of the json file"""
+
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self._lock = threading.RLock()
+        self._csets = OrderedDict()
+
+    def get(self, path):
+        path = os.path.abspath(path)
+        key = (path, os.path.getmtime(path))
+        with self._lock:
+            if key in self._csets:
+                self._csets.move_to_end(key)
+                return self._csets[key]
+
+            # Drop any entry for an older version of the same file
+            for old_key in [k for k in self._csets if k[0] == path]:
+                del self._csets[old_key]
+
+            cset = correctionlib.CorrectionSet.from_file(decompressed_path(path))
+            self._csets[key] = cset
+            while len(self._csets) > self.maxsize:
+                self._csets.popitem(last=False)
+            return cset
+
+    def clear(self):
+        with self._lock:
+            self._csets.clear()
+
+    def __len__(self):
+        return len(self._csets)
+
+
+correction_set_cache = CorrectionSetCache()
+
+
+def load_correction_set(path):
+    """Returns the (cached) CorrectionSet for a correctionlib json (or json.gz) file"""
+    return correction_set_cache.get(path)
+
+
+def fill_disk_cache(paths=None):
+    """Decompress correction files into the on-disk cache ahead of time (by default all of the POG json files)
+    Returns the list of cached files"""
+    if disk_cache.get_cache_dir("clib") is None:
+        raise Exception(f"Error: The on-disk cache is not enabled, please set {disk_cache.CACHE_DIR_ENV}.")
+    if paths is None:
+        pog_dir = topcoffea_path("data/POG")
+        paths = []
+        for root, dirs, files in os.walk(pog_dir):
+            paths.extend(os.path.join(root, f) for f in sorted(files) if f.endswith(".json.gz"))
+    return [decompressed_path(path) for path in paths]
@@ -1,11 +1,17 @@
 import numpy as np
 import awkward as ak
+import numba
 import uproot
 from coffea import lookup_tools
-import correctionlib
 import re
+import json
+from functools import lru_cache
+from collections.abc import Mapping
 
 from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.correction_cache import load_correction_set, open_json
+import topcoffea.modules.disk_cache as disk_cache
+from topcoffea.modules.utils import cache_per_year
 from topcoffea.modules.get_param_from_jsons import GetParam
 get_tc_param = GetParam(topcoffea_path("params/params.json"))
 
@@ -55,25 +61,115 @@ def get_method1a_wgt_doublewp(effA, effB, sfA, sfB, cutA, cutB, cutC):
 
     return pData, pMC
 
+# Batched versions of the method 1a weights above, for many btag sf variations at once
+#   - The sfs are given as a list of jagged arrays, a record of jagged arrays (e.g. from btag_sf_eval_multi), or a (n_syst x n_jets) array of flat sfs
+#   - All of the variations share the jet offsets of the eff arrays, the products over the jets of each event are done in a single numba pass
+#   - The products are accumulated directly (rather than as sums of logs), since 1-eff*sf can be <= 0 and that has to give the same result as the unbatched functions
+
+def _flat_jets(arr, dtype):
+    if isinstance(arr, np.ndarray):
+        return np.ascontiguousarray(arr, dtype=dtype)
+    return np.ascontiguousarray(ak.to_numpy(ak.flatten(arr)), dtype=dtype)
+
+def _stack_flat_sfs(sfs):
+    if isinstance(sfs, np.ndarray) and sfs.ndim == 2:
+        return np.ascontiguousarray(sfs, dtype=np.float64)
+    if isinstance(sfs, ak.Array) and len(ak.fields(sfs)) > 0:
+        sfs = [sfs[field] for field in ak.fields(sfs)]
+    return np.stack([_flat_jets(sf, np.float64) for sf in sfs])
+
+def _jet_offsets(jagged):
+    return np.concatenate([[0], np.cumsum(ak.to_numpy(ak.num(jagged, axis=-1)))])
+
+@numba.njit(error_model="numpy")
+def _method1a_singlewp_kernel(offsets, eff, sfs, passes_tag):
+    n_syst = sfs.shape[0]
+    n_events = len(offsets) - 1
+    wgt = np.empty((n_syst, n_events))
+    for ev in range(n_events):
+        p_mc = 1.0
+        for j in range(offsets[ev], offsets[ev+1]):
+            p_mc *= eff[j] if passes_tag[j] else 1.0 - eff[j]
+        for isyst in range(n_syst):
+            p_data = 1.0
+            for j in range(offsets[ev], offsets[ev+1]):
+                eff_data = eff[j]*sfs[isyst, j]
+                p_data *= eff_data if passes_tag[j] else 1.0 - eff_data
+            wgt[isyst, ev] = p_data/p_mc
+    return wgt
+
+@numba.njit(error_model="numpy")
+def _method1a_doublewp_kernel(offsets, effA, effB, sfsA, sfsB, cutA, cutB, cutC):
+    n_syst = sfsA.shape[0]
+    n_events = len(offsets) - 1
+    pData = np.empty((n_syst, n_events))
+    pMC = np.empty(n_events)
+    for ev in range(n_events):
+        p_mc = 1.0
+        for j in range(offsets[ev], offsets[ev+1]):
+            if cutA[j]: p_mc *= effA[j]
+            if cutB[j]: p_mc *= effB[j] - effA[j]
+            if cutC[j]: p_mc *= 1.0 - effB[j]
+        pMC[ev] = 1.0 if p_mc == 0 else p_mc # removeing zeroes from denominator...
+        for isyst in range(n_syst):
+            p_data = 1.0
+            for j in range(offsets[ev], offsets[ev+1]):
+                effA_data = effA[j]*sfsA[isyst, j]
+                effB_data = effB[j]*sfsB[isyst, j]
+                if cutA[j]: p_data *= effA_data
+                if cutB[j]: p_data *= effB_data - effA_data
+                if cutC[j]: p_data *= 1.0 - effB_data
+            pData[isyst, ev] = p_data
+    return pData, pMC
+
+# Same as get_method1a_wgt_singlewp, returns a (n_syst x n_events) array of weights
+def get_method1a_wgt_singlewp_multi(eff,sfs,passes_tag):
+    offsets = _jet_offsets(eff)
+    return _method1a_singlewp_kernel(offsets, _flat_jets(eff, np.float64), _stack_flat_sfs(sfs), _flat_jets(passes_tag, np.bool_))
+
+# Same as get_method1a_wgt_doublewp, returns pData as a (n_syst x n_events) array and pMC as a n_events array
+def get_method1a_wgt_doublewp_multi(effA, effB, sfsA, sfsB, cutA, cutB, cutC):
+    offsets = _jet_offsets(effA)
+    return _method1a_doublewp_kernel(
+        offsets,
+        _flat_jets(effA, np.float64),
+        _flat_jets(effB, np.float64),
+        _stack_flat_sfs(sfsA),
+        _stack_flat_sfs(sfsB),
+        _flat_jets(cutA, np.bool_),
+        _flat_jets(cutB, np.bool_),
+        _flat_jets(cutC, np.bool_),
+    )
+
 # Evaluate btag sf from central correctionlib json
 def btag_sf_eval(jet_collection,wp,year,method,syst):
-    # Get the right sf json for the given year
+    return btag_sf_eval_multi(jet_collection,{"sf": (syst,wp)},year,method)["sf"]
 
+# Evaluate several btag sf variations from central correctionlib json in one pass
+#   - Takes a list of (syst,wp) pairs, or a dictionary {name: (syst,wp)}
+#   - The jet collection is flattened once, and all of the variations are unflattened together with the original offsets
+#   - Returns a record of jagged arrays, one field per variation (named "{syst}_{wp}" if a list of pairs is given)
+def btag_sf_eval_multi(jet_collection,syst_wp_lst,year,method):
+    # Get the right sf json for the given year
     clib_year = clib_year_map[year]
     fname = topcoffea_path(f"data/POG/BTV/{clib_year}/btagging.json.gz")
 
+    if not isinstance(syst_wp_lst,dict):
+        syst_wp_lst = {f"{syst}_{wp}": (syst,wp) for syst,wp in syst_wp_lst}
+
     # Flatten the input (until correctionlib handles jagged data natively)
-    abseta_flat = ak.flatten(abs(jet_collection.eta))
-    pt_flat = ak.flatten(jet_collection.pt)
-    flav_flat = ak.flatten(jet_collection.hadronFlavour)
+    counts = ak.num(jet_collection.pt)
+    abseta_flat = np.abs(ak.to_numpy(ak.flatten(jet_collection.eta)))
+    pt_flat = ak.to_numpy(ak.flatten(jet_collection.pt))
+    flav_flat = ak.to_numpy(ak.flatten(jet_collection.hadronFlavour))
 
     # For now, cap all pt at 1000 https://cms-talk.web.cern.ch/t/question-about-evaluating-sfs-with-correctionlib/31763
-    pt_flat = ak.where(pt_flat>1000.0,1000.0,pt_flat)
+    pt_flat = np.minimum(pt_flat,1000.0)
 
-    # Evaluate the SF
-    ceval = correctionlib.CorrectionSet.from_file(fname)
-    sf_flat = ceval[method].evaluate(syst,wp,flav_flat,abseta_flat,pt_flat)
-    sf = ak.unflatten(sf_flat,ak.num(jet_collection.pt))
+    # Evaluate the SFs
+    ceval = load_correction_set(fname)[method]
+    sf_flat = {name: ceval.evaluate(syst,wp,flav_flat,abseta_flat,pt_flat) for name,(syst,wp) in syst_wp_lst.items()}
+    sf = ak.unflatten(ak.zip(sf_flat),counts)
 
     return sf
 
@@ -111,34 +207,62 @@ def GetMCPUname(year):
     ''' Returns the name of the file to read pu MC profile '''
     return MCPUfile[str(year)]
 
-PUfunc = {}
-### Load histograms and get lookup tables (extractors are not working here...)
-for year in ['2016', '2016APV', '2017', '2018']:
-    PUfunc[year] = {}
-    with uproot.open(pudirpath+GetMCPUname(year)) as fMC:
-        hMC = fMC['pileup']
-        PUfunc[year]['MC'] = lookup_tools.dense_lookup.dense_lookup(
-            hMC.values() / np.sum(hMC.values()),
-            hMC.axis(0).edges()
-        )
-    with uproot.open(pudirpath + GetDataPUname(year,'nominal')) as fData:
-        hD = fData['pileup']
-        PUfunc[year]['Data'] = lookup_tools.dense_lookup.dense_lookup(
-            hD.values() / np.sum(hD.values()),
-            hD.axis(0).edges()
-        )
-    with uproot.open(pudirpath + GetDataPUname(year,'up')) as fDataUp:
-        hDUp = fDataUp['pileup']
-        PUfunc[year]['DataUp'] = lookup_tools.dense_lookup.dense_lookup(
-            hDUp.values() / np.sum(hDUp.values()),
-            hD.axis(0).edges()
-        )
-    with uproot.open(pudirpath + GetDataPUname(year, 'down')) as fDataDo:
-        hDDo = fDataDo['pileup']
-        PUfunc[year]['DataDo'] = lookup_tools.dense_lookup.dense_lookup(
-            hDDo.values() / np.sum(hDDo.values()),
-            hD.axis(0).edges()
-        )
+def LoadPUprofiles(year):
+    ''' Returns the normalized MC and Data (nominal, up, down) pileup profiles and their bin edges for a given year
+        The profiles are stored in the on-disk cache (if enabled), so that uproot is only needed the first time '''
+    year = str(year)
+    fnames = {
+        'MC': pudirpath + GetMCPUname(year),
+        'Data': pudirpath + GetDataPUname(year, 'nominal'),
+        'DataUp': pudirpath + GetDataPUname(year, 'up'),
+        'DataDo': pudirpath + GetDataPUname(year, 'down'),
+    }
+    sources = list(fnames.values())
+    profiles = disk_cache.load_arrays("pileup", f"pu_profiles_{year}", sources)
+    if profiles is not None:
+        return profiles
+
+    profiles = {}
+    for key, fname in fnames.items():
+        with uproot.open(fname) as f:
+            h = f['pileup']
+            profiles[key] = h.values() / np.sum(h.values())
+            profiles[key + '_edges'] = h.axis(0).edges()
+    # The Data up/down variations are binned as the nominal Data profile
+    profiles['DataUp_edges'] = profiles['Data_edges']
+    profiles['DataDo_edges'] = profiles['Data_edges']
+    disk_cache.save_arrays("pileup", f"pu_profiles_{year}", sources, profiles)
+    return profiles
+
+class LazyPUfunc(Mapping):
+    ''' Mapping of the pileup lookup tables for each year of MCPUfile, e.g. PUfunc['2017']['MC']
+        All of the years are listed as keys, but the tables of a year are only built (and memoized) the first time they are accessed '''
+    def __init__(self):
+        self._tables = {}
+
+    def __getitem__(self, year):
+        year = str(year)
+        if year not in MCPUfile:
+            raise KeyError(year)
+        if year not in self._tables:
+            profiles = LoadPUprofiles(year)
+            self._tables[year] = {
+                key: lookup_tools.dense_lookup.dense_lookup(profiles[key], profiles[key + '_edges'])
+                for key in ['MC', 'Data', 'DataUp', 'DataDo']
+            }
+        return self._tables[year]
+
+    def __contains__(self, year):
+        # Does not build the tables of the year
+        return str(year) in MCPUfile
+
+    def __iter__(self):
+        return iter(MCPUfile)
+
+    def __len__(self):
+        return len(MCPUfile)
+
+PUfunc = LazyPUfunc()
 
 def GetPUSF(nTrueInt, year, var='nominal'):
     year = str(year)
@@ -147,7 +271,7 @@ def GetPUSF(nTrueInt, year, var='nominal'):
 
     clib_year = clib_year_map[year]
     json_path = topcoffea_path(f"data/POG/LUM/{clib_year}/puWeights.json.gz")
-    ceval = correctionlib.CorrectionSet.from_file(json_path)
+    ceval = load_correction_set(json_path)
 
     pucorr_tag = goldenJSON_map[year]
     pu_corr = ceval[pucorr_tag].evaluate(nTrueInt, var)
@@ -155,9 +279,150 @@ def GetPUSF(nTrueInt, year, var='nominal'):
 
 
 
+class PileupWeighter:
+    ''' Pileup weights for a given year, from the LUM POG json (same values as GetPUSF)
+        The nominal, up and down weight histograms are extracted once into a single (3 x n_bins) table,
+        so that all of the variations are obtained with one digitize and one gather '''
+
+    variations = ['nominal', 'up', 'down']
+
+    def __init__(self, year):
+        year = str(year)
+        if year not in clib_year_map.keys():
+            raise Exception(f"Error: Unknown year \"{year}\".")
+        self.year = year
+
+        json_path = topcoffea_path(f"data/POG/LUM/{clib_year_map[year]}/puWeights.json.gz")
+        with open_json(json_path) as f:
+            corrections = json.load(f)["corrections"]
+        pu_corr = [corr for corr in corrections if corr["name"] == goldenJSON_map[year]][0]
+
+        hists = {item["key"]: item["value"] for item in pu_corr["data"]["content"]}
+        self.edges = np.array(hists["nominal"]["edges"], dtype=np.float64)
+        for var in self.variations:
+            if hists[var]["edges"] != hists["nominal"]["edges"] or hists[var]["flow"] != "clamp":
+                raise Exception(f"Error: Unexpected binning for the \"{var}\" pileup weights of year \"{year}\".")
+        self.table = np.array([hists[var]["content"] for var in self.variations], dtype=np.float64)
+
+    def evaluate(self, nTrueInt):
+        ''' Returns a dict with the nominal, up and down weights for an array of nTrueInt '''
+        # Values outside of the binning are clamped to the first/last bin
+        idx = np.digitize(np.asarray(nTrueInt), self.edges[1:-1])
+        wgts = self.table[:, idx]
+        return dict(zip(self.variations, wgts))
+
+    def __call__(self, nTrueInt):
+        return self.evaluate(nTrueInt)
+
+@cache_per_year(clib_year_map)
+def GetPileupWeighter(year):
+    return PileupWeighter(year)
+
+
 ###############################################################
 ###### Scale, PS weights (as implimented for TOP-22-006) ######
 ###############################################################
+# Define the PS weight mapping we are looking for
+ps_map = {
+    'ISR=0.5 FSR=1': 'ISRDown',
+    'ISR=2 FSR=1': 'ISRUp',
+    'ISR=1 FSR=0.5': 'FSRDown',
+    'ISR=1 FSR=2': 'FSRUp'
+}
+
+# Define the scale weight mapping we are looking for in the three scenarios
+scale_scenarios_map = {
+    # Scenario 1: renscfact and facscfact for 9 weights
+    "renscfact": {
+        "scale_map": {
+            'renscfact=0.5d0 facscfact=0.5d0': 'renormfactDown',
+            'renscfact=0.5d0 facscfact=1d0': 'renormDown',
+            'renscfact=0.5d0 facscfact=2d0': 'renormDown_factUp',
+            'renscfact=1d0 facscfact=0.5d0': 'factDown',
+            #'renscfact=1d0 facscfact=1d0': 'nominal',  # Handle nominal
+            'renscfact=1d0 facscfact=2d0': 'factUp',
+            'renscfact=2d0 facscfact=0.5d0': 'renormUp_factDown',
+            'renscfact=2d0 facscfact=1d0': 'renormUp',
+            'renscfact=2d0 facscfact=2d0': 'renormfactUp'
+        },
+        "re_pattern": r'\[(\d+)\] is renscfact=(\d+\.?\d*)d0 facscfact=(\d+\.?\d*)d0',
+        "key": lambda match: f'renscfact={match[1]}d0 facscfact={match[2]}d0'
+    },
+    # Scenario 2: MUF and MUR for 9 weights
+    "MUF9": {
+        "scale_map": {
+            'MUF="0.5" MUR="0.5"': 'renormDown_factDown',
+            'MUF="1.0" MUR="0.5"': 'renormDown',
+            'MUF="2.0" MUR="0.5"': 'renormDown_factUp',
+            'MUF="0.5" MUR="1.0"': 'factDown',
+            #'MUF="1.0" MUR="1.0"': 'nominal',  # Explicitly handle the nominal case
+            'MUF="2.0" MUR="1.0"': 'factUp',
+            'MUF="0.5" MUR="2.0"': 'renormUp_factDown',
+            'MUF="1.0" MUR="2.0"': 'renormUp',
+            'MUF="2.0" MUR="2.0"': 'renormUp_factUp'
+        },
+        "re_pattern": r'\[(\d+)\] is MUF="(\d+\.?\d*)" MUR="(\d+\.?\d*)"',
+        "key": lambda match: f'MUF="{match[1]}" MUR="{match[2]}"'
+    },
+    # Scenario 3: MUF and MUR for 8 weights
+    "MUF8": {
+        "scale_map": {
+            'MUF="0.5" MUR="0.5"': 'renormDown_factDown',
+            'MUF="1.0" MUR="0.5"': 'renormDown',
+            'MUF="2.0" MUR="0.5"': 'renormDown_factUp',
+            'MUF="0.5" MUR="1.0"': 'factDown',
+            'MUF="2.0" MUR="1.0"': 'factUp',
+            'MUF="0.5" MUR="2.0"': 'renormUp_factDown',
+            'MUF="1.0" MUR="2.0"': 'renormUp',
+            'MUF="2.0" MUR="2.0"': 'renormUp_factUp'
+        },
+        "re_pattern": r'\[(\d+)\] is MUF="(\d+\.?\d*)" MUR="(\d+\.?\d*)"',
+        "key": lambda match: f'MUF="{match[1]}" MUR="{match[2]}"'
+    }
+}
+
+# The docstrings are the same for every chunk of a dataset, so they are only parsed once
+# Both functions return a tuple of (name, index) pairs, with the order of the maps above
+@lru_cache(maxsize=64)
+def get_ps_indices(psweight_doc):
+    # Extract the relevant information from the docstring
+    # Example pattern: [0] is ISR=2 FSR=1
+    pattern = r'\[(\d+)\] is ISR=(\d+\.?\d*) FSR=(\d+\.?\d*)'
+    ps_indices = {}
+    for index, isr, fsr in re.findall(pattern, psweight_doc):
+        key = f'ISR={isr} FSR={fsr}'
+        if key in ps_map:
+            ps_indices[ps_map[key]] = int(index)
+
+    # Check if all needed weights were found
+    if not all(key in ps_indices for key in ps_map.values()):
+        raise Exception('Not all ISR/FSR weight variations found in PSWeight.__doc__!')
+    return tuple((key, ps_indices[key]) for key in ps_map.values())
+
+@lru_cache(maxsize=64)
+def get_scale_indices(scale_weight_doc, scenario):
+    if scenario is None:
+        #This part of the code assumes that every entry is unit when LHEScaleWeight is not actually filled
+        dummy_keys = list(scale_scenarios_map["MUF9"]["scale_map"].values())
+        return tuple((dummy_key, id_key) for id_key, dummy_key in enumerate(dummy_keys))
+
+    matches = re.findall(scale_scenarios_map[scenario]["re_pattern"], scale_weight_doc)
+    scale_map = scale_scenarios_map[scenario]["scale_map"]
+    key = scale_scenarios_map[scenario]["key"]
+
+    # Parse the matches and build the scale indices dictionary
+    scale_indices = {}
+    for match in matches:
+        key_str = key(match)  # Dynamically get the key string based on the case
+        if key_str in scale_map:
+            scale_indices[scale_map[key_str]] = int(match[0])
+
+    # Check if all needed weights were found
+    required_keys = list(scale_map.values())
+    if not all(key in scale_indices for key in required_keys):
+        raise Exception('Not all scale weight variations found in LHEScaleWeight.__doc__!')
+    return tuple((key, scale_indices[key]) for key in required_keys)
+
 def AttachPSWeights(events):
     '''
     Retrieve ISR and FSR variations from PS weights based on the docstring in events.PSWeight.__doc__
@@ -180,42 +445,12 @@ def AttachPSWeights(events):
     if not psweight_doc:
         raise Exception('PSWeight.__doc__ is empty or not available!')
 
-    # Define the mapping we are looking for
-    ps_map = {
-        'ISR=0.5 FSR=1': 'ISRDown',
-        'ISR=2 FSR=1': 'ISRUp',
-        'ISR=1 FSR=0.5': 'FSRDown',
-        'ISR=1 FSR=2': 'FSRUp'
-    }
+    ps_indices = get_ps_indices(psweight_doc)
 
-    # Extract the relevant information from the docstring
-    # Example pattern: [0] is ISR=2 FSR=1
-    pattern = r'\[(\d+)\] is ISR=(\d+\.?\d*) FSR=(\d+\.?\d*)'
-    matches = re.findall(pattern, psweight_doc)
-
-    # Dictionary to hold the index of each variation
-    ps_indices = {}
-
-    for match in matches:
-        index, isr, fsr = match
-        key = f'ISR={isr} FSR={fsr}'
-        if key in ps_map:
-            ps_indices[ps_map[key]] = int(index)
-
-    # Retrieve required keys from ps_map values
-    required_keys = ps_map.values() # It's an iterable in py3, not a list anymore!
-
-    # Check if all needed weights were found
-    if not all(key in ps_indices for key in required_keys):
-        raise Exception('Not all ISR/FSR weight variations found in PSWeight.__doc__!')
-
-    # Add up variation event weights
-    events['ISRUp'] = events.PSWeight[:, ps_indices['ISRUp']]
-    events['FSRUp'] = events.PSWeight[:, ps_indices['FSRUp']]
-
-    # Add down variation event weights
-    events['ISRDown'] = events.PSWeight[:, ps_indices['ISRDown']]
-    events['FSRDown'] = events.PSWeight[:, ps_indices['FSRDown']]
+    # Pick all of the variations at once, then add the event weights
+    ps_weights = ak.to_numpy(events.PSWeight[:, [index for _, index in ps_indices]])
+    for i, (key, _) in enumerate(ps_indices):
+        events[key] = ps_weights[:, i]
 
 def AttachScaleWeights(events):
     """
@@ -247,115 +482,31 @@ def AttachScaleWeights(events):
     if events.LHEScaleWeight is None:
         raise Exception('LHEScaleWeight not found!')
 
-    # Get the LHEScaleWeight documentation
-    scale_weight_doc = events.LHEScaleWeight.__doc__
-
-    does_doc_exist = True
-    if not scale_weight_doc:
-        #raise Exception('LHEScaleWeight.__doc__ is empty or not available!')
-        does_doc_exist = False
-
-    # Define the mapping we are looking for the three scenarios
-    scenarios_map = {
-        # Scenario 1: renscfact and facscfact for 9 weights
-        "renscfact": {
-            "scale_map": {
-                'renscfact=0.5d0 facscfact=0.5d0': 'renormfactDown',
-                'renscfact=0.5d0 facscfact=1d0': 'renormDown',
-                'renscfact=0.5d0 facscfact=2d0': 'renormDown_factUp',
-                'renscfact=1d0 facscfact=0.5d0': 'factDown',
-                #'renscfact=1d0 facscfact=1d0': 'nominal',  # Handle nominal
-                'renscfact=1d0 facscfact=2d0': 'factUp',
-                'renscfact=2d0 facscfact=0.5d0': 'renormUp_factDown',
-                'renscfact=2d0 facscfact=1d0': 'renormUp',
-                'renscfact=2d0 facscfact=2d0': 'renormfactUp'
-            },
-            "re_pattern": r'\[(\d+)\] is renscfact=(\d+\.?\d*)d0 facscfact=(\d+\.?\d*)d0',
-            "key": lambda match: f'renscfact={match[1]}d0 facscfact={match[2]}d0'
-        },
-        # Scenario 2: MUF and MUR for 9 weights
-        "MUF9": {
-            "scale_map": {
-                'MUF="0.5" MUR="0.5"': 'renormDown_factDown',
-                'MUF="1.0" MUR="0.5"': 'renormDown',
-                'MUF="2.0" MUR="0.5"': 'renormDown_factUp',
-                'MUF="0.5" MUR="1.0"': 'factDown',
-                #'MUF="1.0" MUR="1.0"': 'nominal',  # Explicitly handle the nominal case
-                'MUF="2.0" MUR="1.0"': 'factUp',
-                'MUF="0.5" MUR="2.0"': 'renormUp_factDown',
-                'MUF="1.0" MUR="2.0"': 'renormUp',
-                'MUF="2.0" MUR="2.0"': 'renormUp_factUp'
-            },
-            "re_pattern": r'\[(\d+)\] is MUF="(\d+\.?\d*)" MUR="(\d+\.?\d*)"',
-            "key": lambda match: f'MUF="{match[1]}" MUR="{match[2]}"'
-        },
-        # Scenario 3: MUF and MUR for 8 weights
-        "MUF8": {
-            "scale_map": {
-                'MUF="0.5" MUR="0.5"': 'renormDown_factDown',
-                'MUF="1.0" MUR="0.5"': 'renormDown',
-                'MUF="2.0" MUR="0.5"': 'renormDown_factUp',
-                'MUF="0.5" MUR="1.0"': 'factDown',
-                'MUF="2.0" MUR="1.0"': 'factUp',
-                'MUF="0.5" MUR="2.0"': 'renormUp_factDown',
-                'MUF="1.0" MUR="2.0"': 'renormUp',
-                'MUF="2.0" MUR="2.0"': 'renormUp_factUp'
-            },
-            "re_pattern": r'\[(\d+)\] is MUF="(\d+\.?\d*)" MUR="(\d+\.?\d*)"',
-            "key": lambda match: f'MUF="{match[1]}" MUR="{match[2]}"'
-        }
-    }
+    # Get the LHEScaleWeight documentation (may be empty)
+    scale_weight_doc = events.LHEScaleWeight.__doc__ or ""
 
     # Determine the number of weights available
-    len_of_wgts = ak.count(events.LHEScaleWeight, axis=-1)
-    all_len_9_or_0_bool = ak.all((len_of_wgts == 9) | (len_of_wgts == 0))
-    all_len_8_or_0_bool = ak.all((len_of_wgts == 8) | (len_of_wgts == 0))
-    scale_weights = None
-    scale_map = None
-    matches = None
+    len_of_wgts = np.unique(ak.to_numpy(ak.num(events.LHEScaleWeight, axis=1)))
     scenario = None
 
     # Choose between the different cases based on the number of weights and the doc string
-    if all_len_9_or_0_bool:
+    if np.all((len_of_wgts == 9) | (len_of_wgts == 0)):
         if "renscfact" in scale_weight_doc:
             scenario = "renscfact"  # Scenario 1: renscfact/facscfact
         elif "MUF" in scale_weight_doc:
             scenario = "MUF9"       # Scenario 2: MUF/MUR with 9 weights
-    elif all_len_8_or_0_bool:
+    elif np.all((len_of_wgts == 8) | (len_of_wgts == 0)):
         scenario = "MUF8"           # Scenario 3: MUF/MUR with 8 weights
     else:
         raise Exception("Unknown weight type")
 
-    scale_weights = ak.fill_none(ak.pad_none(events.LHEScaleWeight, 9 if (scenario == "MUF9" or scenario == "renscfact" or scenario is None) else 8), 1)
-    # Dictionary to hold the index of each variation
-    scale_indices = {}
-
-    if scenario is not None:
-        matches = re.findall(scenarios_map[scenario]["re_pattern"], scale_weight_doc)
-        scale_map = scenarios_map[scenario]["scale_map"]
-        key = scenarios_map[scenario]["key"]
-
-        # Parse the matches and build the scale indices dictionary
-        for match in matches:
-            index = int(match[0])  # Extract the index from the regex match
-            key_str = key(match)  # Dynamically get the key string based on the case
-
-            if key_str in scale_map:
-                scale_indices[scale_map[key_str]] = index
+    scale_indices = get_scale_indices(scale_weight_doc, scenario)
 
-        required_keys = list(scale_map.values())
-
-        # Check if all needed weights were found
-        if not all(key in scale_indices for key in required_keys):
-            missing_keys = [key for key in required_keys if key not in scale_indices]
-            raise Exception('Not all scale weight variations found in LHEScaleWeight.__doc__!')
-
-    else:
-        #This part of the code assumes that every entry is unit when LHEScaleWeight is not actually filled
-        dummy_keys = list(scenarios_map["MUF9"]["scale_map"].values())
-        for id_key, dummy_key in enumerate(dummy_keys):
-            scale_indices[dummy_key] = id_key
+    # Pad the (possibly empty) lists into a regular array, then pick all of the variations at once
+    n_wgts = 8 if scenario == "MUF8" else 9
+    scale_weights = ak.to_numpy(ak.fill_none(ak.pad_none(events.LHEScaleWeight, n_wgts, clip=True), 1))
+    scale_weights = scale_weights[:, [index for _, index in scale_indices]]
 
-    # Assign the weights from the event to the respective fields dynamically using a loop
-    for key in scale_indices:
-        events[key] = scale_weights[:, scale_indices[key]]
+    # Assign the weights from the event to the respective fields
+    for i, (key, _) in enumerate(scale_indices):
+        events[key] = scale_weights[:, i]
@@ -0,0 +1,93 @@
+"""Counter-based random numbers
+
+The random numbers of an object are given by the Philox4x32-10 generator (Salmon et al., "Parallel random
+numbers: as easy as 1, 2, 3") keyed by (run, lumi) with the counter (event, object index, stream), so they
+only depend on the object itself: they are the same for any chunking of the events, and can be reproduced.
+Each kind of objects (e.g. jets and muons) uses its own stream, so their random numbers are independent.
+"""
+
+import numpy as np
+import awkward as ak
+import numba
+
+# Streams of the objects that use counter-based random numbers
+STREAM_JETS = 0
+STREAM_MUONS = 1
+
+# Philox4x32-10 constants
+_PHILOX_M0 = np.uint64(0xD2511F53)
+_PHILOX_M1 = np.uint64(0xCD9E8D57)
+_PHILOX_W0 = np.uint64(0x9E3779B9)
+_PHILOX_W1 = np.uint64(0xBB67AE85)
+_MASK32 = np.uint64(0xFFFFFFFF)
+_SHIFT32 = np.uint64(32)
+_SHIFT21 = np.uint64(21)
+_SHIFT11 = np.uint64(11)
+
+
+@numba.njit
+def _philox4x32(c0, c1, c2, c3, k0, k1):
+    for _ in range(10):
+        p0 = _PHILOX_M0 * c0
+        p1 = _PHILOX_M1 * c2
+        c0, c1, c2, c3 = (
+            ((p1 >> _SHIFT32) ^ c1 ^ k0) & _MASK32,
+            p1 & _MASK32,
+            ((p0 >> _SHIFT32) ^ c3 ^ k1) & _MASK32,
+            p0 & _MASK32,
+        )
+        k0 = (k0 + _PHILOX_W0) & _MASK32
+        k1 = (k1 + _PHILOX_W1) & _MASK32
+    return c0, c1, c2, c3
+
+
+@numba.njit
+def _counter_words(run, lumi, event, index, stream):
+    # Key: (run, lumi), counter: (event, index, stream)
+    x0, x1, _, _ = _philox4x32(
+        event & _MASK32, event >> _SHIFT32, index & _MASK32, stream,
+        run & _MASK32, lumi & _MASK32,
+    )
+    return x0, x1
+
+
+@numba.njit
+def _rand_gauss_kernel(run, lumi, event, index, stream, out):
+    for i in range(len(out)):
+        x0, x1 = _counter_words(run[i], lumi[i], event[i], index[i], stream)
+        # Box-Muller, with u1 in (0, 1]
+        u1 = (x0 + 1.0) / 4294967296.0
+        u2 = x1 / 4294967296.0
+        out[i] = np.sqrt(-2.0 * np.log(u1)) * np.cos(2.0 * np.pi * u2)
+
+
+@numba.njit
+def _rand_uniform_kernel(run, lumi, event, index, stream, out):
+    for i in range(len(out)):
+        x0, x1 = _counter_words(run[i], lumi[i], event[i], index[i], stream)
+        # 53 random bits, so that the numbers are in [0, 1)
+        out[i] = ((x0 << _SHIFT21) | (x1 >> _SHIFT11)) / 9007199254740992.0
+
+
+def _counter_columns(run, lumi, event, objects):
+    # Flat (run, lumi, event, object index) of each object of the jagged array objects
+    index = ak.flatten(ak.local_index(objects, axis=1))
+    return [np.ascontiguousarray(ak.to_numpy(column), dtype=np.uint64) for column in (run, lumi, event, index)]
+
+
+def counter_rand_gauss(run, lumi, event, objects, stream=STREAM_JETS):
+    """Flat gaussian random numbers (float32), one for each object of the jagged array objects
+    run, lumi and event are flat arrays with the values of each object"""
+    columns = _counter_columns(run, lumi, event, objects)
+    out = np.empty(len(columns[0]), dtype=np.float32)
+    _rand_gauss_kernel(*columns, np.uint64(stream), out)
+    return ak.Array(out)
+
+
+def counter_rand_uniform(run, lumi, event, objects, stream=STREAM_JETS):
+    """Flat uniform random numbers in [0, 1) (float64), one for each object of the jagged array objects
+    run, lumi and event are flat arrays with the values of each object"""
+    columns = _counter_columns(run, lumi, event, objects)
+    out = np.empty(len(columns[0]), dtype=np.float64)
+    _rand_uniform_kernel(*columns, np.uint64(stream), out)
+    return out
@@ -0,0 +1,79 @@
+"""Helpers for the optional on-disk caches of topcoffea
+
+Lookup tables that are expensive to build (e.g. histograms read with uproot) can be stored
+as numpy arrays, so that they are only converted once. The caches are only used if the
+TOPCOFFEA_CACHE_DIR environment variable points to a (writable) directory, e.g. local scratch.
+Each entry is tagged with the path, size and mtime of the files it was built from, and it
+is rebuilt if any of them change.
+"""
+
+import os
+import hashlib
+import tempfile
+
+import numpy as np
+
+CACHE_DIR_ENV = "TOPCOFFEA_CACHE_DIR"
+
+
+def get_cache_dir(subdir=None):
+    """Returns the cache directory (created if needed), or None if the cache is not enabled"""
+    cache_dir = os.environ.get(CACHE_DIR_ENV)
+    if not cache_dir:
+        return None
+    if subdir is not None:
+        cache_dir = os.path.join(cache_dir, subdir)
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+    except OSError:
+        return None
+    return cache_dir
+
+
+def source_key(*paths):
+    """Short hash identifying the current version of a set of source files"""
+    h = hashlib.sha1()
+    for path in paths:
+        st = os.stat(path)
+        h.update(f"{os.path.abspath(path)}:{st.st_size}:{st.st_mtime_ns};".encode())
+    return h.hexdigest()[:16]
+
+
+def atomic_write(path, write_func, suffix=""):
+    """Write a file via a temporary file in the same directory, so that concurrent readers never see a partial file"""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=suffix)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write_func(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_arrays(subdir, name, sources):
+    """Returns the dict of arrays cached for the given source files, or None if there is no valid entry"""
+    cache_dir = get_cache_dir(subdir)
+    if cache_dir is None:
+        return None
+    path = os.path.join(cache_dir, f"{name}_{source_key(*sources)}.npz")
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as f:
+            return {k: f[k] for k in f.files}
+    except (OSError, ValueError):
+        return None
+
+
+def save_arrays(subdir, name, sources, arrays):
+    """Store a dict of arrays in the cache (does nothing if the cache is not enabled or not writable)"""
+    cache_dir = get_cache_dir(subdir)
+    if cache_dir is None:
+        return
+    path = os.path.join(cache_dir, f"{name}_{source_key(*sources)}.npz")
+    try:
+        atomic_write(path, lambda f: np.savez(f, **arrays), suffix=".npz")
+    except OSError:
+        pass
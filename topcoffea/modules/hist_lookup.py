@@ -0,0 +1,106 @@
+"""Lookup tables from the histograms in ROOT files (fake rates, lepton and photon SFs)
+
+All of the TH1/TH2 histograms of a file are converted once into numpy arrays of edges and
+values (plus the errors, as sqrt of the variances), and stored in the on-disk cache if it is
+enabled (see disk_cache), so that uproot only has to read each file once.
+The lookups follow the conventions of the coffea dense_lookup (and extractor):
+    - The arguments are given in the order of the axes of the histogram (e.g. (eta, pt) for the EGamma SFs)
+    - Values outside of the binning are clamped to the first/last bin
+    - The errors of histogram "name" are available as "name_error"
+"""
+
+import os
+from functools import lru_cache
+
+import numpy as np
+import awkward as ak
+import uproot
+
+import topcoffea.modules.disk_cache as disk_cache
+
+# Separates the histogram name and the array name in the cached npz files
+_KEY_SEP = "::"
+
+
+def read_root_hists(path):
+    """Returns a dictionary with the values, errors and edges of all of the histograms in a ROOT file
+    The keys are "{hist}::values", "{hist}::errors" and "{hist}::edges{i}" for each axis i"""
+    arrays = {}
+    with uproot.open(path) as f:
+        names = {key.rsplit(";", 1)[0] for key, cls in f.classnames().items() if cls.startswith(("TH1", "TH2"))}
+        for name in sorted(names):
+            # The latest cycle is used if there are several
+            hist = f[name]
+            arrays[f"{name}{_KEY_SEP}values"] = hist.values(flow=False)
+            arrays[f"{name}{_KEY_SEP}errors"] = np.sqrt(hist.variances(flow=False))
+            for i, axis in enumerate(hist.axes):
+                arrays[f"{name}{_KEY_SEP}edges{i}"] = axis.edges(flow=False)
+    return arrays
+
+
+def load_root_hists(path):
+    """Same as read_root_hists, from the on-disk cache if possible"""
+    name = os.path.basename(path)
+    arrays = disk_cache.load_arrays("hist_lookup", name, [path])
+    if arrays is None:
+        arrays = read_root_hists(path)
+        disk_cache.save_arrays("hist_lookup", name, [path], arrays)
+    return arrays
+
+
+class HistLookup:
+    """Dense lookup of the values of a histogram
+    Takes one flat or jagged array per axis, and returns an array with the same structure"""
+
+    def __init__(self, values, edges):
+        self.values = np.asarray(values)
+        self.edges = tuple(np.asarray(e) for e in edges)
+        if self.values.shape != tuple(len(e) - 1 for e in self.edges):
+            raise Exception(f"Error: Values of shape {self.values.shape} do not match the binning.")
+
+    def __call__(self, *args):
+        if len(args) != len(self.edges):
+            raise Exception(f"Error: Expected {len(self.edges)} arguments, got {len(args)}.")
+
+        # Flatten the jagged inputs (all of them have the same structure)
+        counts = None
+        flat_args = []
+        for arg in args:
+            if isinstance(arg, ak.Array) and arg.ndim > 1:
+                counts = ak.num(arg, axis=1)
+                arg = ak.flatten(arg)
+            flat_args.append(np.asarray(arg))
+
+        idx = tuple(
+            np.clip(np.searchsorted(edges, x, side="right") - 1, 0, len(edges) - 2)
+            for edges, x in zip(self.edges, flat_args)
+        )
+        out = self.values[idx]
+        if counts is not None:
+            out = ak.unflatten(out, counts)
+        return out
+
+
+@lru_cache(maxsize=None)
+def load_hist_lookups(path):
+    """Returns a dictionary of HistLookup for all of the histograms in a ROOT file (and their errors, as "{hist}_error")"""
+    arrays = load_root_hists(path)
+    lookups = {}
+    for key in arrays:
+        name, array_name = key.rsplit(_KEY_SEP, 1)
+        if array_name != "values":
+            continue
+        edges = []
+        while f"{name}{_KEY_SEP}edges{len(edges)}" in arrays:
+            edges.append(arrays[f"{name}{_KEY_SEP}edges{len(edges)}"])
+        lookups[name] = HistLookup(arrays[key], edges)
+        lookups[f"{name}_error"] = HistLookup(arrays[f"{name}{_KEY_SEP}errors"], edges)
+    return lookups
+
+
+def get_hist_lookup(path, name):
+    """Returns the HistLookup for one histogram of a ROOT file (or its errors, with a "_error" suffix)"""
+    lookups = load_hist_lookups(path)
+    if name not in lookups:
+        raise Exception(f"Error: Histogram \"{name}\" not found in \"{path}\".")
+    return lookups[name]
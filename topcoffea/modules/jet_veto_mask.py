@@ -0,0 +1,139 @@
+"""Jet veto maps
+
+The (eta, phi) maps of the jetvetomaps.json.gz files in data/POG/JME are extracted once into dense
+numpy grids, and evaluated with the vectorized binning of hist_lookup on the flattened jet arrays.
+Following the JME recommendations, a jet is vetoed if the map is nonzero in its (eta, phi) bin.
+As in correctionlib, the flow declared in the json is respected: with "error" (all of the current maps),
+the jets outside of the binning (|eta| >= 5.191, or phi at or slightly above pi) raise an exception,
+unless clamp=True is given, in which case they are clamped to the first/last bin.
+The selection of the jets that are used for the veto (pt, id, overlap with muons...) is left to the caller.
+"""
+
+import os
+import json
+
+import numpy as np
+import awkward as ak
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.correction_cache import open_json
+from topcoffea.modules.hist_lookup import HistLookup
+import topcoffea.modules.disk_cache as disk_cache
+from topcoffea.modules.utils import cache_per_year
+
+jet_veto_map_dir_map = {
+    "2016APV": "2016preVFP_UL",
+    "2016preVFP": "2016preVFP_UL",
+    "2016": "2016postVFP_UL",
+    "2017": "2017_UL",
+    "2018": "2018_UL",
+    "2022": "2022_Summer22",
+    "2022EE": "2022_Summer22EE",
+    "2023": "2023_Summer23",
+    "2023BPix": "2023_Summer23BPix",
+}
+
+# Separates the map type and the array name in the cached npz files
+_KEY_SEP = "::"
+
+
+def _binning_edges(edges):
+    # Non uniform binnings are lists of edges, uniform ones are given by their number of bins and limits
+    if isinstance(edges, dict):
+        return np.linspace(edges["low"], edges["high"], edges["n"] + 1)
+    return np.asarray(edges, dtype=np.float64)
+
+
+def extract_jet_veto_maps(path, correction=None):
+    """Returns a dictionary with the values, edges and flow of all of the maps of a jet veto map correction
+    The keys are "{type}::values", "{type}::eta", "{type}::phi" and "{type}::flow" for each map type (e.g. "jetvetomap")
+    By default, the file must have a single correction"""
+    with open_json(path) as f:
+        corrections = {corr["name"]: corr for corr in json.load(f)["corrections"]}
+    if correction is None:
+        if len(corrections) != 1:
+            raise Exception(f"Error: Several corrections in \"{path}\", please choose one of {sorted(corrections)}.")
+        correction = next(iter(corrections))
+    if correction not in corrections:
+        raise Exception(f"Error: Correction \"{correction}\" not found in \"{path}\".")
+    node = corrections[correction]["data"]
+    if node["nodetype"] != "category":
+        raise Exception(f"Error: Unexpected node \"{node['nodetype']}\" for the map types of \"{correction}\".")
+
+    arrays = {}
+    for entry in node["content"]:
+        binning = entry["value"]
+        if binning["nodetype"] != "multibinning" or binning["inputs"] != ["eta", "phi"]:
+            raise Exception(f"Error: Map \"{entry['key']}\" of \"{correction}\" is not an (eta, phi) binning.")
+        eta_edges, phi_edges = (_binning_edges(edges) for edges in binning["edges"])
+        # The content is in row-major order, with the last input (phi) running fastest
+        values = np.asarray(binning["content"], dtype=np.float64).reshape(len(eta_edges) - 1, len(phi_edges) - 1)
+        arrays[f"{entry['key']}{_KEY_SEP}values"] = values
+        arrays[f"{entry['key']}{_KEY_SEP}eta"] = eta_edges
+        arrays[f"{entry['key']}{_KEY_SEP}phi"] = phi_edges
+        if binning["flow"] not in ("error", "clamp"):
+            raise Exception(f"Error: Unsupported flow {binning['flow']} for map \"{entry['key']}\" of \"{correction}\".")
+        arrays[f"{entry['key']}{_KEY_SEP}flow"] = np.array(binning["flow"])
+    return arrays
+
+
+def load_jet_veto_maps(path, correction=None):
+    """Same as extract_jet_veto_maps, from the on-disk cache if possible"""
+    name = f"{os.path.basename(os.path.dirname(path))}_{correction}"
+    arrays = disk_cache.load_arrays("jetvetomask", name, [path])
+    if arrays is None:
+        arrays = extract_jet_veto_maps(path, correction)
+        disk_cache.save_arrays("jetvetomask", name, [path], arrays)
+    return arrays
+
+
+class JetVetoMask:
+    """Jet veto map of a given type (e.g. "jetvetomap", or "jetvetomap_hem1516" for 2018)
+    If clamp is True, the jets outside of the binning are clamped to the first/last bin even if the
+    map declares an "error" flow"""
+
+    def __init__(self, path, map_type="jetvetomap", correction=None, clamp=False):
+        self.path = path
+        self.map_type = map_type
+        arrays = load_jet_veto_maps(path, correction)
+        if f"{map_type}{_KEY_SEP}values" not in arrays:
+            types = sorted({key.rsplit(_KEY_SEP, 1)[0] for key in arrays})
+            raise Exception(f"Error: Map type \"{map_type}\" not found in \"{path}\", the available ones are {types}.")
+        self.clamp = clamp or str(arrays[f"{map_type}{_KEY_SEP}flow"]) == "clamp"
+        self.lookup = HistLookup(
+            arrays[f"{map_type}{_KEY_SEP}values"],
+            [arrays[f"{map_type}{_KEY_SEP}eta"], arrays[f"{map_type}{_KEY_SEP}phi"]],
+        )
+
+    def _check_range(self, eta, phi):
+        for name, x, edges in zip(["eta", "phi"], [eta, phi], self.lookup.edges):
+            x = ak.flatten(x) if isinstance(x, ak.Array) and x.ndim > 1 else x
+            x = np.asarray(x)
+            outside = ~((x >= edges[0]) & (x < edges[-1]))
+            if np.any(outside):
+                raise Exception(
+                    f"Error: {np.count_nonzero(outside)} jet(s) with {name} outside of [{edges[0]}, {edges[-1]}) for map \"{self.map_type}\""
+                    f" (e.g. {x[outside][0]}), use clamp=True to clamp them to the edge bins."
+                )
+
+    def values(self, eta, phi):
+        """Values of the map for flat or jagged jet arrays"""
+        if not self.clamp:
+            self._check_range(eta, phi)
+        return self.lookup(eta, phi)
+
+    def jet_veto(self, eta, phi):
+        """Per-jet mask (with the structure of the inputs), True for the jets in a vetoed region"""
+        return self.values(eta, phi) > 0
+
+    def event_veto(self, eta, phi):
+        """Per-event boolean numpy array from jagged jet arrays, True for the events with at least one jet in a vetoed region"""
+        return ak.to_numpy(ak.any(self.jet_veto(eta, phi), axis=1))
+
+    def __call__(self, eta, phi):
+        return self.jet_veto(eta, phi)
+
+
+@cache_per_year(jet_veto_map_dir_map)
+def get_jet_veto_mask(year, map_type="jetvetomap", clamp=False):
+    return JetVetoMask(topcoffea_path(f"data/POG/JME/{jet_veto_map_dir_map[year]}/jetvetomaps.json.gz"), map_type, clamp=clamp)
@@ -0,0 +1,80 @@
+"""Golden json lumi masks
+
+Each certification json in data/goldenJsons is compiled into two sorted arrays with the first and
+last lumisection of every certified range, encoded as run << 32 | lumi. Masking the events is then
+a single np.searchsorted.
+"""
+
+import os
+import json
+
+import numpy as np
+import awkward as ak
+
+from topcoffea.modules.paths import topcoffea_path
+import topcoffea.modules.disk_cache as disk_cache
+from topcoffea.modules.utils import cache_per_year
+
+golden_json_map = {
+    "2016APV": "Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt",
+    "2016": "Cert_271036-284044_13TeV_Legacy2016_Collisions16_JSON.txt",
+    "2017": "Cert_294927-306462_13TeV_UL2017_Collisions17_GoldenJSON.txt",
+    "2018": "Cert_314472-325175_13TeV_Legacy2018_Collisions18_JSON.txt",
+    "2022": "Cert_Collisions2022_355100_362760_Golden.txt",
+    "2022EE": "Cert_Collisions2022_355100_362760_Golden.txt",
+    "2023": "Cert_Collisions2023_366442_370790_Golden.txt",
+    "2023BPix": "Cert_Collisions2023_366442_370790_Golden.txt",
+    "2024": "Cert_Collisions2024_378981_386951_Golden.json",
+}
+
+
+def _run_lumi_key(runs, lumis):
+    return (np.asarray(runs, dtype=np.uint64) << np.uint64(32)) | np.asarray(lumis, dtype=np.uint64)
+
+
+def compile_golden_json(path):
+    """Returns the sorted start and end keys (run << 32 | lumi) of the certified lumisection ranges of a golden json"""
+    with open(path) as f:
+        certified = json.load(f)
+    runs, firsts, lasts = [], [], []
+    for run, ranges in certified.items():
+        for first, last in ranges:
+            runs.append(int(run))
+            firsts.append(first)
+            lasts.append(last)
+    starts = _run_lumi_key(runs, firsts)
+    ends = _run_lumi_key(runs, lasts)
+    order = np.argsort(starts, kind="stable")
+    starts, ends = starts[order], ends[order]
+    if np.any(starts[1:] <= ends[:-1]):
+        raise Exception(f"Error: Overlapping lumisection ranges in \"{path}\".")
+    return {"starts": starts, "ends": ends}
+
+
+class LumiMask:
+    """Mask of the certified (run, luminosityBlock) pairs of a golden json"""
+
+    def __init__(self, path):
+        self.path = path
+        name = os.path.splitext(os.path.basename(path))[0]
+        ranges = disk_cache.load_arrays("lumimask", name, [path])
+        if ranges is None:
+            ranges = compile_golden_json(path)
+            disk_cache.save_arrays("lumimask", name, [path], ranges)
+        self.starts = ranges["starts"]
+        self.ends = ranges["ends"]
+
+    def __call__(self, runs, lumis):
+        """Returns a boolean numpy array, True for the events in a certified lumisection"""
+        if not isinstance(runs, np.ndarray):
+            runs = ak.to_numpy(runs)
+        if not isinstance(lumis, np.ndarray):
+            lumis = ak.to_numpy(lumis)
+        keys = _run_lumi_key(runs, lumis)
+        idx = np.searchsorted(self.starts, keys, side="right") - 1
+        return (idx >= 0) & (keys <= self.ends[np.maximum(idx, 0)])
+
+
+@cache_per_year(golden_json_map)
+def get_lumi_mask(year):
+    return LumiMask(topcoffea_path(f"data/goldenJsons/{golden_json_map[year]}"))
@@ -1,4 +1,5 @@
 import os
+from functools import lru_cache
 import awkward as ak
 
 import matplotlib.pyplot as plt
@@ -107,6 +108,83 @@ def get_quad_keys(wc_lst):
     return quad_terms_lst
 
 
+# Parse a tuple of quad fit key strings (e.g. ("sm*sm","ctG*sm",...)) into a list of WC names and two index arrays
+#   - The WC names are in order of appearance (so "sm" is first for the usual ordering of the keys)
+#   - The terms are wc_names[idx1]*wc_names[idx2]
+#   - Cached, since the same set of keys is typically evaluated many times
+@lru_cache(maxsize=64)
+def parse_quad_keys(keys_tup):
+    wc_names_lst = []
+    name_idx = {}
+    idx1 = np.empty(len(keys_tup),dtype=np.intp)
+    idx2 = np.empty(len(keys_tup),dtype=np.intp)
+    for i,key_str in enumerate(keys_tup):
+        wc1,wc2 = key_str.split("*")
+        for wc in (wc1,wc2):
+            if wc not in name_idx:
+                name_idx[wc] = len(wc_names_lst)
+                wc_names_lst.append(wc)
+        idx1[i] = name_idx[wc1]
+        idx2[i] = name_idx[wc2]
+    idx1.flags.writeable = False
+    idx2.flags.writeable = False
+    return tuple(wc_names_lst), idx1, idx2
+
+
+# Array representation of a quad fit: a list of WC names, the index arrays of the two WCs of each term, and the coefficient vector
+#   - If the index arrays are not specified, the usual "lower triangle" ordering of the terms is assumed (see get_quad_fit_dict)
+#   - The string keyed dict form is available via to_dict()
+class QuadFit:
+
+    def __init__(self,wc_names_lst,quad_coeffs_arr,idx1=None,idx2=None):
+        self.coeffs = np.asarray(quad_coeffs_arr,dtype=float)
+        if idx1 is None or idx2 is None:
+            if "sm" not in wc_names_lst: wc_names_lst = ["sm"] + list(wc_names_lst)
+            idx1,idx2 = np.tril_indices(len(wc_names_lst))
+        self.wc_names = list(wc_names_lst)
+        self.idx1 = np.asarray(idx1,dtype=np.intp)
+        self.idx2 = np.asarray(idx2,dtype=np.intp)
+        if self.coeffs.shape[-1] != len(self.idx1):
+            raise Exception(f"Error: Wrong number of coefficients for the quad fit. Require {len(self.idx1)}, received {self.coeffs.shape[-1]}.")
+
+    # Build the array representation from a fit dictionary (e.g. {"sm*sm": 1.0, "ctG*sm": 0.5, ...})
+    @classmethod
+    def from_dict(cls,fit_dict):
+        wc_names_lst,idx1,idx2 = parse_quad_keys(tuple(fit_dict.keys()))
+        return cls(wc_names_lst,np.fromiter(fit_dict.values(),dtype=float,count=len(fit_dict)),idx1,idx2)
+
+    # The string keyed dictionary form of the fit
+    def to_dict(self):
+        return {self.wc_names[i]+"*"+self.wc_names[j]: c for i,j,c in zip(self.idx1,self.idx2,self.coeffs)}
+
+    # Get the (n_pts x n_wc) array of WC values for the names in the fit ("sm" is always 1)
+    #   - The point(s) can be a dict of WC values (or arrays of values), or a (n_pts x n_wc) array ordered as the WC names of the fit without "sm"
+    #   - Missing WCs are set to 0, with a single warning per call
+    def get_wc_arr(self,wcpt):
+        if isinstance(wcpt,dict):
+            missing_lst = [wc for wc in self.wc_names if (wc != "sm") and (wc not in wcpt)]
+            if len(missing_lst) > 0:
+                print(f"WARNING: No value specified for WCs {missing_lst}. Setting them to 0.")
+            cols = [np.atleast_1d(np.asarray(1.0 if wc == "sm" else wcpt.get(wc,0.0),dtype=float)) for wc in self.wc_names]
+            return np.column_stack(np.broadcast_arrays(*cols))
+        wc_arr = np.atleast_2d(np.asarray(wcpt,dtype=float))
+        non_sm_idx = [i for i,wc in enumerate(self.wc_names) if wc != "sm"]
+        if wc_arr.shape[-1] != len(non_sm_idx):
+            raise Exception(f"Error: Wrong number of WC values. Require {len(non_sm_idx)}, received {wc_arr.shape[-1]}.")
+        out = np.ones((len(wc_arr),len(self.wc_names)))
+        out[:,non_sm_idx] = wc_arr
+        return out
+
+    # Evaluate the fit at one or a batch of points in the wc phase space
+    def eval(self,wcpt):
+        wc_arr = self.get_wc_arr(wcpt)
+        return (wc_arr[:,self.idx1]*wc_arr[:,self.idx2]) @ self.coeffs
+
+    # Get constant, linear, quadratic term for a give WC
+    def get_1d_fit(self,wc):
+        return get_1d_fit(self.to_dict(),wc)
+
+
 ########## Plotting tools ##########
 
 # Takes two arrays and returnes a shifted differences
@@ -216,10 +294,6 @@ def get_summed_quad_fit_arr(events):
 # Given a quad fit array and a list of WCs, make a dictionary mapping the quad fit terms to their WCs
 def get_quad_fit_dict(wc_names_lst,quad_coeffs_arr):
 
-    # Prepend "sm" to wc names list
-    wc_names_lst = ["sm"] + wc_names_lst
-
-    # Fill a dict with wc names and the corresponding quad fit terms
     # The order of the quad coeff array is the "lower triangle" of the matrix
     # I.e. if the list of WC names is [c1,c2,...,cn], the order of the quad terms is:
     #     quad terms = [
@@ -229,15 +303,7 @@ def get_quad_fit_dict(wc_names_lst,quad_coeffs_arr):
     #         ...
     #         cn*sm,  ... , cn*cn
     #     ]
-    wc_fit_dict = {}
-    idx = 0
-    for i in range(len(wc_names_lst)):
-        for j in range(i+1):
-            key_str = wc_names_lst[i]+"*"+wc_names_lst[j]
-            wc_fit_dict[key_str] = quad_coeffs_arr[idx]
-            idx+=1
-
-    return wc_fit_dict
+    return QuadFit(["sm"] + wc_names_lst,quad_coeffs_arr).to_dict()
 
 
 ########## Manipulate quad fit dict ##########
@@ -263,28 +329,13 @@ def scale_fit_dict(fit_dict,scale_val):
 def scale_to_sm(fit_dict):
     return scale_fit_dict(fit_dict,1.0/fit_dict["sm*sm"])
 
-# Evalueate a fit dictionary at some point in the wc phase space
+# Evalueate a fit dictionary (or QuadFit) at some point in the wc phase space
+#   - The values in wcpt_dict can also be arrays, in order to evaluate a batch of points at once
 def eval_fit(fit_dict,wcpt_dict):
-    xsec = 0
-    for wc_str, coeff_val in fit_dict.items():
-        wc1,wc2 = wc_str.split("*")
-        if wc1 not in wcpt_dict:
-            if wc1 == "sm":
-                wc1_val = 1.0
-            else:
-                print(f"WARNING: No value specified for WC {wc1}. Setting it to 0.")
-                wc1_val = 0.0
-        else:
-            wc1_val = wcpt_dict[wc1]
-        if wc2 not in wcpt_dict.keys():
-            if wc2 == "sm":
-                wc2_val = 1.0
-            else:
-                print(f"WARNING: No value specified for WC {wc2}. Setting it to 0.")
-                wc2_val = 0.0
-        else:
-            wc2_val = wcpt_dict[wc2]
-        xsec = xsec + wc1_val*wc2_val*coeff_val
+    quad_fit = fit_dict if isinstance(fit_dict,QuadFit) else QuadFit.from_dict(fit_dict)
+    xsec = quad_fit.eval(wcpt_dict)
+    if isinstance(wcpt_dict,dict) and all(np.ndim(v) == 0 for v in wcpt_dict.values()):
+        return xsec[0]
     return xsec
 
 
@@ -297,16 +348,19 @@ def eval_1d_quad( quad_params_1d,x):
 
 
 # Takes as input 1d quadratic fit params, and returns the x value where y crosses some threshold
+#   - Can also take a (n x 3) array of params (and a scalar or n thresholds), in which case x_m and x_p are arrays
 def find_where_fit_crosses_threshold(quad_params_1d,threshold):
 
     # Get the individual params
-    if len(quad_params_1d) != 3:
-        raise Exception(f"Error: Wrong number of parameters specified for 1d quadratic. Require 3, received {len(quad_params_1d)}.")
-    s0 = quad_params_1d[0]
-    s1 = quad_params_1d[1]
-    s2 = quad_params_1d[2]
-
-    x_p = (-s1 + np.sqrt(s1*s1 - 4.0*s2*(s0-threshold)) )/(2.0*s2)
-    x_m = (-s1 - np.sqrt(s1*s1 - 4.0*s2*(s0-threshold)) )/(2.0*s2)
+    quad_params_1d = np.asarray(quad_params_1d,dtype=float)
+    if quad_params_1d.shape[-1] != 3:
+        raise Exception(f"Error: Wrong number of parameters specified for 1d quadratic. Require 3, received {quad_params_1d.shape[-1]}.")
+    s0 = quad_params_1d[...,0]
+    s1 = quad_params_1d[...,1]
+    s2 = quad_params_1d[...,2]
+
+    sqrt_disc = np.sqrt(s1*s1 - 4.0*s2*(s0-threshold))
+    x_p = (-s1 + sqrt_disc)/(2.0*s2)
+    x_m = (-s1 - sqrt_disc)/(2.0*s2)
 
     return [x_m,x_p]
@@ -0,0 +1,338 @@
+"""Rochester muon momentum corrections
+
+The RoccoR*UL.txt tables in data/MuonScale are parsed once into numpy arrays, and the
+corrections are evaluated on flat or jagged muon arrays with numba kernels. The definitions follow the RoccoR C++ code (and the
+coffea rochester_lookup):
+    - Data: kScaleDT
+    - MC with a matched gen muon: kSpreadMC
+    - MC without a matched gen muon: kSmearMC, with a random number u per muon (counter-based in muon_corrections)
+The uncertainties are the quadrature sum over the correction sets of the rms over the members.
+"""
+
+import math
+import os
+
+import numpy as np
+import awkward as ak
+import numba
+
+from topcoffea.modules.paths import topcoffea_path
+import topcoffea.modules.disk_cache as disk_cache
+from topcoffea.modules.utils import cache_per_year
+from topcoffea.modules.counter_rng import counter_rand_uniform, STREAM_MUONS
+
+rochester_year_map = {
+    "2016APV": "RoccoR2016aUL.txt",
+    "2016preVFP": "RoccoR2016aUL.txt",
+    "2016": "RoccoR2016bUL.txt",
+    "2017": "RoccoR2017UL.txt",
+    "2018": "RoccoR2018UL.txt",
+}
+
+# Index of the data and mc parameters in the tables
+TYPE_MC = 0
+TYPE_DATA = 1
+
+
+def parse_rochester_file(path):
+    """Parse a RoccoR txt file into a dictionary of numpy arrays
+        - The scale parameters (M, A) are stored for every (set, member) pair, in the order of the file, with shape (n_var, 2, n_eta, n_phi)
+        - The resolution parameters are only given for the first member of the first set (as in RoccoR, they are the same for all of them)
+    """
+    header = {}
+    rows = []
+    with open(path) as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            if fields[0].isalpha():
+                header[fields[0]] = fields[1:]
+            else:
+                rows.append(fields)
+
+    nsets = int(header["NSET"][0])
+    nmem = np.array([int(x) for x in header["NMEM"]], dtype=np.int64)
+    if len(nmem) != nsets:
+        raise Exception(f"Error: Inconsistent number of sets in \"{path}\".")
+    nphi = int(header["CPHI"][0])
+    neta = int(header["CETA"][0])
+    nmin = int(header["RMIN"][0])
+    ntrk = int(header["RTRK"][0])
+    nabseta = int(header["RETA"][0])
+
+    var_offsets = np.concatenate([[0], np.cumsum(nmem)])
+    M = np.full((var_offsets[-1], 2, neta, nphi), np.nan)
+    A = np.full((var_offsets[-1], 2, neta, nphi), np.nan)
+    kRes = np.full((2, nabseta), np.nan)
+    # rsPars (3 terms of the resolution vs pt), then the crystal ball s, a, n
+    res = np.full((6, nabseta, ntrk), np.nan)
+
+    for fields in rows:
+        setn, membern, tag = int(fields[0]), int(fields[1]), fields[2]
+        ivar = var_offsets[setn] + membern
+        if tag == "C":
+            t, v, b = (int(x) for x in fields[3:6])
+            values = np.array(fields[6:], dtype=np.float64)
+            if v == 0:
+                M[ivar, t, b] = 1.0 + values * 0.01
+            elif v == 1:
+                A[ivar, t, b] = values * 0.01
+        elif ivar != 0:
+            continue
+        elif tag == "F":
+            kRes[int(fields[3])] = np.array(fields[4:], dtype=np.float64)
+        elif tag == "R":
+            v, b = int(fields[3]), int(fields[4])
+            values = np.array(fields[5:], dtype=np.float64)
+            res[v, b] = values * 0.01 if v == 2 else values
+        elif tag != "T":
+            raise Exception(f"Error: Unknown tag \"{tag}\" in \"{path}\".")
+
+    if np.isnan(M).any() or np.isnan(A).any() or np.isnan(kRes).any() or np.isnan(res).any():
+        raise Exception(f"Error: Missing parameters in \"{path}\".")
+
+    return {
+        "nmem": nmem,
+        "nmin": np.array(nmin),
+        "eta_edges": np.array(header["CETA"][1:], dtype=np.float64),
+        "phi_edges": np.arange(nphi + 1) * 2 * np.pi / nphi - np.pi,
+        "abseta_edges": np.array(header["RETA"][1:], dtype=np.float64),
+        "M": M,
+        "A": A,
+        "kRes": kRes,
+        "res": res,
+    }
+
+
+def load_rochester_tables(path):
+    """Returns the parsed tables of a RoccoR txt file, from the on-disk cache if possible"""
+    name = os.path.splitext(os.path.basename(path))[0]
+    tables = disk_cache.load_arrays("rochester", name, [path])
+    if tables is None:
+        tables = parse_rochester_file(path)
+        disk_cache.save_arrays("rochester", name, [path], tables)
+    return tables
+
+
+################################################################
+###### Kernels ######
+################################################################
+
+@numba.njit
+def _find_bin(edges, x):
+    # Values outside of the binning go to the first/last bin
+    i = np.searchsorted(edges, x, side="right") - 1
+    return min(max(i, 0), len(edges) - 2)
+
+@numba.njit
+def _norm_ppf(p):
+    # Inverse of the standard normal cdf (Acklam's approximation refined with one Halley step)
+    if p <= 0.0:
+        return -np.inf
+    if p >= 1.0:
+        return np.inf
+    if p < 0.02425:
+        q = math.sqrt(-2.0 * math.log(p))
+        x = (((((-7.784894002430293e-03 * q - 3.223964580411365e-01) * q - 2.400758277161838e+00) * q - 2.549732539343734e+00) * q + 4.374664141464968e+00) * q + 2.938163982698783e+00) / ((((7.784695709041462e-03 * q + 3.224671290700398e-01) * q + 2.445134137142996e+00) * q + 3.754408661907416e+00) * q + 1.0)
+    elif p > 1.0 - 0.02425:
+        q = math.sqrt(-2.0 * math.log(1.0 - p))
+        x = -(((((-7.784894002430293e-03 * q - 3.223964580411365e-01) * q - 2.400758277161838e+00) * q - 2.549732539343734e+00) * q + 4.374664141464968e+00) * q + 2.938163982698783e+00) / ((((7.784695709041462e-03 * q + 3.224671290700398e-01) * q + 2.445134137142996e+00) * q + 3.754408661907416e+00) * q + 1.0)
+    else:
+        q = p - 0.5
+        r = q * q
+        x = (((((-3.969683028665376e+01 * r + 2.209460984245205e+02) * r - 2.759285104469687e+02) * r + 1.383577518672690e+02) * r - 3.066479806614716e+01) * r + 2.506628277459239e+00) * q / (((((-5.447609879822406e+01 * r + 1.615858368580409e+02) * r - 1.556989798598866e+02) * r + 6.680131188771972e+01) * r - 1.328068155288572e+01) * r + 1.0)
+    e = 0.5 * math.erfc(-x / math.sqrt(2.0)) - p
+    u = e * math.sqrt(2.0 * math.pi) * math.exp(0.5 * x * x)
+    return x - u / (1.0 + 0.5 * x * u)
+
+@numba.njit
+def _double_cb_ppf(u, a, n, s):
+    # Inverse cdf of a symmetric double sided crystal ball (gaussian core within |x/s| < a, power law tails of power n)
+    ex = math.exp(-0.5 * a * a)
+    tail_norm = (n / a) ** n * ex
+    tail_int = n / a / (n - 1.0) * ex
+    core_int = math.sqrt(2.0 * math.pi) * math.erf(a / math.sqrt(2.0))
+    total = core_int + 2.0 * tail_int
+    b = n / a - a
+    cdf_tail = tail_int / total
+    if u < cdf_tail:
+        return s * (b - (u * total * (n - 1.0) / tail_norm) ** (-1.0 / (n - 1.0)))
+    if u > 1.0 - cdf_tail:
+        return -s * (b - ((1.0 - u) * total * (n - 1.0) / tail_norm) ** (-1.0 / (n - 1.0)))
+    p = (u * total - tail_int) / math.sqrt(2.0 * math.pi) + 0.5 * math.erfc(a / math.sqrt(2.0))
+    return s * _norm_ppf(p)
+
+@numba.njit
+def _k_scale(M, A, eta_edges, phi_edges, ivar, itype, charge, pt, eta, phi):
+    ieta = _find_bin(eta_edges, eta)
+    iphi = _find_bin(phi_edges, phi)
+    return 1.0 / (M[ivar, itype, ieta, iphi] + charge * A[ivar, itype, ieta, iphi] * pt)
+
+@numba.njit
+def _k_spread(kRes, abseta_edges, genpt, kpt, eta):
+    h = _find_bin(abseta_edges, abs(eta))
+    x = genpt / kpt
+    return x / (1.0 + (x - 1.0) * kRes[TYPE_DATA, h] / kRes[TYPE_MC, h])
+
+@numba.njit
+def _k_extra(kRes, res, abseta_edges, nmin, kpt, eta, nl, u):
+    h = _find_bin(abseta_edges, abs(eta))
+    f = min(max(nl - nmin, 0), res.shape[2] - 1)
+    k_data = kRes[TYPE_DATA, h]
+    k_mc = kRes[TYPE_MC, h]
+    if k_data <= k_mc:
+        return 1.0
+    dpt = kpt - 45.0
+    sigma = res[0, h, f] + res[1, h, f] * dpt + res[2, h, f] * dpt * dpt
+    x = math.sqrt(k_data * k_data - k_mc * k_mc) * sigma * _double_cb_ppf(u, res[4, h, f], res[5, h, f], res[3, h, f])
+    if x > -1.0:
+        return 1.0 / (1.0 + x)
+    return 1.0
+
+@numba.njit
+def _k_full(M, A, eta_edges, phi_edges, kRes, res, abseta_edges, nmin, ivar, itype, resolution, charge, pt, eta, phi, genpt, nl, u):
+    k = _k_scale(M, A, eta_edges, phi_edges, ivar, itype, charge, pt, eta, phi)
+    if resolution:
+        # Spread if there is a matched gen muon (genpt > 0), smear otherwise
+        if genpt > 0:
+            k *= _k_spread(kRes, abseta_edges, genpt, k * pt, eta)
+        else:
+            k *= _k_extra(kRes, res, abseta_edges, nmin, k * pt, eta, nl, u)
+    return k
+
+@numba.njit
+def _rochester_kernel(M, A, eta_edges, phi_edges, kRes, res, abseta_edges, nmin, ivar, itype, resolution, var_wgts, charge, pt, eta, phi, genpt, nl, u):
+    # Returns the correction for the variation ivar, and (if var_wgts is not empty) its uncertainty
+    n = len(pt)
+    k = np.empty(n)
+    err = np.empty(n if len(var_wgts) > 0 else 0)
+    for i in range(n):
+        k[i] = _k_full(M, A, eta_edges, phi_edges, kRes, res, abseta_edges, nmin, ivar, itype, resolution, charge[i], pt[i], eta[i], phi[i], genpt[i], nl[i], u[i])
+        if len(var_wgts) > 0:
+            k0 = k[i] if ivar == 0 else _k_full(M, A, eta_edges, phi_edges, kRes, res, abseta_edges, nmin, 0, itype, resolution, charge[i], pt[i], eta[i], phi[i], genpt[i], nl[i], u[i])
+            sum2 = 0.0
+            for jvar in range(1, len(var_wgts)):
+                d = _k_full(M, A, eta_edges, phi_edges, kRes, res, abseta_edges, nmin, jvar, itype, resolution, charge[i], pt[i], eta[i], phi[i], genpt[i], nl[i], u[i]) - k0
+                sum2 += d * d * var_wgts[jvar]
+            err[i] = math.sqrt(sum2)
+    return k, err
+
+
+################################################################
+###### Evaluator ######
+################################################################
+
+class RochesterCorrections:
+    """Evaluator for the corrections of one RoccoR txt file
+    All of the methods take flat (numpy) or jagged (awkward) arrays, and return the same structure
+    s and m select the correction set and member (default 0, 0, i.e. the nominal corrections)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        tables = load_rochester_tables(path)
+        self.nmem = tables["nmem"]
+        self.nmin = int(tables["nmin"])
+        self.eta_edges = tables["eta_edges"]
+        self.phi_edges = tables["phi_edges"]
+        self.abseta_edges = tables["abseta_edges"]
+        self.M = np.ascontiguousarray(tables["M"])
+        self.A = np.ascontiguousarray(tables["A"])
+        self.kRes = np.ascontiguousarray(tables["kRes"])
+        self.res = np.ascontiguousarray(tables["res"])
+
+        # Weight of each (set, member) variation in the uncertainty
+        self.var_offsets = np.concatenate([[0], np.cumsum(self.nmem)])
+        self.var_wgts = np.repeat(1.0 / self.nmem, self.nmem)
+
+    def _var_index(self, s, m):
+        if s >= len(self.nmem) or m >= self.nmem[s]:
+            raise Exception(f"Error: Unknown Rochester correction set {s} member {m}.")
+        return self.var_offsets[s] + m
+
+    def _evaluate(self, itype, resolution, charge, pt, eta, phi, genpt=None, nl=None, u=None, s=0, m=0, error=False):
+        counts = None
+        if not isinstance(pt, np.ndarray):
+            counts = ak.num(pt, axis=-1)
+
+        def flat(arr, dtype):
+            if counts is not None:
+                arr = ak.flatten(arr)
+            return np.ascontiguousarray(ak.to_numpy(arr) if not isinstance(arr, np.ndarray) else arr, dtype=dtype)
+
+        pt = flat(pt, np.float64)
+        genpt = np.full(len(pt), np.nan) if genpt is None else flat(genpt, np.float64)
+        nl = np.zeros(len(pt), dtype=np.int64) if nl is None else flat(nl, np.int64)
+        u = np.zeros(len(pt)) if u is None else flat(u, np.float64)
+        k, err = _rochester_kernel(
+            self.M, self.A, self.eta_edges, self.phi_edges, self.kRes, self.res, self.abseta_edges, self.nmin,
+            self._var_index(s, m), itype, resolution, self.var_wgts if error else np.empty(0),
+            flat(charge, np.float64), pt, flat(eta, np.float64), flat(phi, np.float64), genpt, nl, u,
+        )
+        out = err if error else k
+        if counts is not None:
+            out = ak.unflatten(out, counts)
+        return out
+
+    def kScaleDT(self, charge, pt, eta, phi, s=0, m=0):
+        """Momentum scale correction for data"""
+        return self._evaluate(TYPE_DATA, False, charge, pt, eta, phi, s=s, m=m)
+
+    def kScaleDTerror(self, charge, pt, eta, phi):
+        """Momentum scale correction uncertainty for data"""
+        return self._evaluate(TYPE_DATA, False, charge, pt, eta, phi, error=True)
+
+    def kScaleMC(self, charge, pt, eta, phi, s=0, m=0):
+        """Momentum scale correction for mc (not recommended, use kSpreadMC instead)"""
+        return self._evaluate(TYPE_MC, False, charge, pt, eta, phi, s=s, m=m)
+
+    def kScaleMCerror(self, charge, pt, eta, phi):
+        """Momentum scale correction uncertainty for mc (not recommended, use kSpreadMC instead)"""
+        return self._evaluate(TYPE_MC, False, charge, pt, eta, phi, error=True)
+
+    def kSpreadMC(self, charge, pt, eta, phi, genpt, s=0, m=0):
+        """Momentum scale correction for mc with a matched gen muon of pt genpt"""
+        return self._evaluate(TYPE_MC, True, charge, pt, eta, phi, genpt=genpt, s=s, m=m)
+
+    def kSpreadMCerror(self, charge, pt, eta, phi, genpt):
+        """Momentum scale correction uncertainty for mc with a matched gen muon of pt genpt"""
+        return self._evaluate(TYPE_MC, True, charge, pt, eta, phi, genpt=genpt, error=True)
+
+    def kSmearMC(self, charge, pt, eta, phi, nl, u, s=0, m=0):
+        """Momentum scale correction for mc without a matched gen muon
+        nl is the number of tracker layers with measurements, and u a random number in [0, 1)"""
+        return self._evaluate(TYPE_MC, True, charge, pt, eta, phi, nl=nl, u=u, s=s, m=m)
+
+    def kSmearMCerror(self, charge, pt, eta, phi, nl, u):
+        """Momentum scale correction uncertainty for mc without a matched gen muon"""
+        return self._evaluate(TYPE_MC, True, charge, pt, eta, phi, nl=nl, u=u, error=True)
+
+    def muon_corrections(self, muons, is_data, run=None, lumi=None, event=None, error=False):
+        """Corrections for a (jagged) collection of nanoAOD muons
+            - For mc, kSpreadMC is used for the muons with a matched gen muon and kSmearMC for the others
+            - The random numbers for the smearing are counter-based (see counter_rng), keyed by (run, lumi, event, muon index),
+              so they are the same for any chunking. run, lumi and event (e.g. events.run) are needed for mc
+        Returns the correction factors for the pt (and their uncertainties if error is True)
+        """
+        if is_data:
+            args = (TYPE_DATA, False, muons.charge, muons.pt, muons.eta, muons.phi)
+            kwargs = {}
+        else:
+            if run is None or lumi is None or event is None:
+                raise Exception("Error: The run, lumi and event of the events are needed for the smearing of the mc muons.")
+            counts = ak.num(muons.pt, axis=-1)
+            genpt = ak.fill_none(muons.matched_gen.pt, np.nan)
+            event_ids = [ak.flatten(ak.broadcast_arrays(column, muons.pt)[0]) for column in (run, lumi, event)]
+            u = ak.unflatten(counter_rand_uniform(*event_ids, muons.pt, stream=STREAM_MUONS), counts)
+            args = (TYPE_MC, True, muons.charge, muons.pt, muons.eta, muons.phi)
+            kwargs = {"genpt": genpt, "nl": muons.nTrackerLayers, "u": u}
+        k = self._evaluate(*args, **kwargs)
+        if not error:
+            return k
+        return k, self._evaluate(*args, **kwargs, error=True)
+
+
+@cache_per_year(rochester_year_map)
+def get_rochester_corrections(year):
+    return RochesterCorrections(topcoffea_path(f"data/MuonScale/{rochester_year_map[year]}"))
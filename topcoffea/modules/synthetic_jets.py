@@ -0,0 +1,118 @@
+"""Random jets and MET, with the correction stacks used to check and time the jet and MET factories
+
+Shared by tests/test_corrected_jets.py and scripts/benchmark_jet_corrections.py, so that both use the same
+inputs. The jets are reproducible for a given seed, and carry the (run, lumi, event) keys of the counter-based
+JER smearing random numbers.
+"""
+
+import warnings
+
+import numpy as np
+import awkward as ak
+from coffea.lookup_tools import extractor
+
+from topcoffea.modules.paths import topcoffea_path
+from topcoffea.modules.JECStack import JECStack
+from topcoffea.modules.CorrectedJetsFactory import CorrectedJetsFactory
+from topcoffea.modules.CorrectedMETFactory import CorrectedMETFactory
+
+jec_tag = "Summer19UL18_V5_MC"
+jer_tag = "Summer19UL18_JRV2_MC"
+junc_types = ["Regrouped_FlavorQCD", "Regrouped_Absolute"]
+junc_sources = [t.split("_", 1)[1] for t in junc_types]
+
+name_map = {
+    "JetPt": "pt",
+    "JetMass": "mass",
+    "JetEta": "eta",
+    "JetPhi": "phi",
+    "JetA": "area",
+    "ptGenJet": "pt_gen",
+    "ptRaw": "pt_raw",
+    "massRaw": "mass_raw",
+    "Rho": "rho",
+    "Run": "run",
+    "LumiBlock": "lumi",
+    "Event": "event",
+}
+met_name_map = dict(name_map, METpt="pt", METphi="phi", UnClusteredEnergyDeltaX="dx", UnClusteredEnergyDeltaY="dy")
+
+
+def make_jets(nevents=1000, seed=1):
+    rng = np.random.default_rng(seed)
+    counts = rng.integers(0, 6, nevents)
+    n = counts.sum()
+    pt = rng.uniform(20, 300, n).astype(np.float32)
+    flat = {
+        "pt": pt,
+        "mass": rng.uniform(2, 30, n).astype(np.float32),
+        "eta": rng.uniform(-2.4, 2.4, n).astype(np.float32),
+        "phi": rng.uniform(-3, 3, n).astype(np.float32),
+        "area": rng.uniform(0.4, 0.6, n).astype(np.float32),
+        "rho": rng.uniform(5, 40, n).astype(np.float32),
+        # Mostly gen matched jets (hybrid smearing), some unmatched ones (stochastic smearing)
+        "pt_gen": np.where(rng.uniform(size=n) < 0.8, pt * rng.uniform(0.95, 1.05, n), 0).astype(np.float32),
+    }
+    flat["pt_raw"] = flat["pt"] * np.float32(0.9)
+    flat["mass_raw"] = flat["mass"] * np.float32(0.9)
+    jets = ak.unflatten(ak.zip(flat), counts)
+    # The event keys of the JER smearing random numbers, broadcast to the jets
+    event_ids = {
+        "run": np.full(nevents, 316187, dtype=np.uint32),
+        "lumi": (np.arange(nevents) // 100 + 1).astype(np.uint32),
+        "event": np.arange(nevents, dtype=np.uint64) * 7919 + (1 << 33),
+    }
+    for field, values in event_ids.items():
+        jets[field] = ak.broadcast_arrays(values, jets.pt)[0]
+    return jets
+
+
+def make_met(nevents, seed=4):
+    rng = np.random.default_rng(seed)
+    return ak.zip({
+        "pt": rng.uniform(0, 100, nevents).astype(np.float32),
+        "phi": rng.uniform(-3, 3, nevents).astype(np.float32),
+        "dx": rng.normal(0, 1, nevents).astype(np.float32),
+        "dy": rng.normal(0, 1, nevents).astype(np.float32),
+    })
+
+
+def make_jecstack_evaluator():
+    ext = extractor()
+    ext.add_weight_sets([
+        f"* * {topcoffea_path(f'data/JEC/{jec_tag}_L1FastJet_AK4PFchs.txt')}",
+        f"* * {topcoffea_path(f'data/JEC/{jec_tag}_L2Relative_AK4PFchs.txt')}",
+        f"* * {topcoffea_path(f'data/JEC/RegroupedV2_{jec_tag}_UncertaintySources_AK4PFchs.junc.txt')}",
+        f"* * {topcoffea_path(f'data/JER/{jer_tag}_PtResolution_AK4PFchs.jr.txt')}",
+        f"* * {topcoffea_path(f'data/JER/{jer_tag}_SF_AK4PFchs.jersf.txt')}",
+    ])
+    ext.finalize()
+    return ext.make_evaluator()
+
+
+def make_jecstack(evaluator):
+    """JECStack of the txt file corrections, with the uncertainty sources of junc_types"""
+    names = [k for k in evaluator.keys() if "Regrouped" not in k or k.split("AK4PFchs_")[-1] in junc_sources]
+    return JECStack(corrections={k: evaluator[k] for k in names})
+
+
+def make_clib_stack(jec_levels, **kwargs):
+    return JECStack(
+        use_clib=True,
+        json_path=topcoffea_path("data/POG/JME/2018_UL/jet_jerc.json.gz"),
+        jec_tag=jec_tag,
+        jec_levels=jec_levels,
+        jet_algo="AK4PFchs",
+        **kwargs,
+    )
+
+
+def build(stack, jets):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        return CorrectedJetsFactory(dict(name_map), stack).build(jets, {})
+
+
+def build_with_met(stack, jets, met):
+    corrected_jets = build(stack, jets)
+    return corrected_jets, CorrectedMETFactory(met_name_map).build(met, corrected_jets, {})
@@ -5,6 +5,8 @@ import gzip
 import pickle
 import cloudpickle
 import uproot
+import inspect
+import functools
 
 pjoin = os.path.join
 
@@ -290,6 +292,30 @@ def get_hist_from_pkl(path_to_pkl, allow_empty=True):
     return h
 
 
+############## Caching tools ##############
+
+# Decorator for the getters of the corrections that are built once per year (and process), e.g. get_lumi_mask(year)
+# The year is checked against the keys of year_map, and converted to str so that e.g. 2018 and "2018" share the same
+# object. The other arguments are normalized with their defaults, so they must be hashable.
+def cache_per_year(year_map):
+    def decorator(func):
+        signature = inspect.signature(func)
+        cached = functools.lru_cache(maxsize=None)(func)
+
+        @functools.wraps(func)
+        def getter(year, *args, **kwargs):
+            year = str(year)
+            if year not in year_map:
+                raise Exception(f"Error: Unknown year \"{year}\".")
+            bound = signature.bind(year, *args, **kwargs)
+            bound.apply_defaults()
+            return cached(*bound.args, **bound.kwargs)
+
+        getter.cache_clear = cached.cache_clear
+        return getter
+    return decorator
+
+
 ############## Dictionary manipulations and tools ##############
 
 # Takes two dictionaries, returns the list of lists [common keys, keys unique to d1, keys unique to d2]
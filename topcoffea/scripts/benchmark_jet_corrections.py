@@ -0,0 +1,128 @@
+import time
+import argparse
+
+import numpy as np
+import awkward as ak
+from coffea.jetmet_tools.FactorizedJetCorrector import FactorizedJetCorrector
+
+from topcoffea.modules.CorrectedJetsFactory import get_corr_inputs
+from topcoffea.modules.CorrectedMETFactory import CorrectedMETFactory, corrected_polar_met
+from topcoffea.modules.synthetic_jets import (
+    jer_tag, junc_types, junc_sources, name_map, met_name_map, make_jets, make_met, make_jecstack_evaluator, make_jecstack, make_clib_stack, build,
+)
+
+# Timings of the jet and MET corrections on the random jets of synthetic_jets (the correctness checks are in tests/test_corrected_jets.py):
+#   - the correctionlib JEC levels, one by one
+#   - the full build with the jecstack (txt files) and the correctionlib corrections, and the jecstack JEC levels
+#   - the batched MET variations, against one MET computation per variation
+# Usage: python benchmark_jet_corrections.py [-n nevents] [-r repeats]
+
+
+def best_time(func, repeats):
+    """Shortest of the wall times of repeats calls of func"""
+    timings = []
+    for _ in range(repeats):
+        tstart = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - tstart)
+    return min(timings)
+
+
+def print_timings(title, timings):
+    print(title)
+    for name, timing in timings.items():
+        print(f"    {name:<50} {1000 * timing:10.2f} ms")
+
+
+def benchmark_clib_jec_levels(jets, repeats):
+    levels = ["L1FastJet", "L2Relative", "L3Absolute", "L2L3Residual"]
+    stack = make_clib_stack(levels)
+    columns = {field: ak.flatten(jets[field]) for field in ak.fields(jets)}
+    jec_name_map = dict(name_map, JetPt="pt_raw", JetMass="mass_raw")
+    timings = {}
+    total = None
+    for lvl, clib_name in zip(levels, stack.jec_names_clib):
+        sf = stack.corrections[clib_name]
+
+        def evaluate():
+            inputs = get_corr_inputs(columns, sf, jec_name_map, cache={}, corrections=total, column_cache={})
+            return sf.evaluate(*inputs).astype(np.float32)
+
+        timings[lvl] = best_time(evaluate, repeats)
+        correction = evaluate()
+        total = correction if total is None else total * correction
+    print_timings("clib JEC levels:", timings)
+
+
+def benchmark_builds(jets, repeats):
+    evaluator = make_jecstack_evaluator()
+    jecstack = make_jecstack(evaluator)
+    clib_stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types)
+
+    def build_all(stack):
+        out = build(stack, jets)
+        ak.materialized(out.pt)
+        for var in ["JER"] + [f"JES_{source}" for source in junc_sources]:
+            for updown in ["up", "down"]:
+                ak.materialized(out[var][updown].pt)
+
+    timings = {
+        "jecstack build": best_time(lambda: build_all(jecstack), repeats),
+        "clib build": best_time(lambda: build_all(clib_stack), repeats),
+    }
+    for name in evaluator.keys():
+        if "L1FastJet" in name or "L2Relative" in name:
+            corrector = FactorizedJetCorrector(**{name: evaluator[name]})
+            args = {k: ak.flatten(jets[name_map[k] if k != "JetPt" else "pt_raw"]) for k in corrector.signature}
+            timings[name] = best_time(lambda: ak.materialized(corrector.getCorrection(**args)), repeats)
+    print_timings("Builds and jecstack JEC levels:", timings)
+
+
+def benchmark_met_variations(jets, repeats):
+    met = make_met(len(jets))
+    stack = make_clib_stack(["L1FastJet", "L2Relative"], jer_tag=jer_tag, junc_types=junc_types)
+    corrected_jets = build(stack, jets)
+    uncertainties = ["JER"] + [f"JES_{source}" for source in junc_sources]
+    # Build the jet variations first, so that only the MET computations are timed
+    for unc in uncertainties:
+        for updown in ["up", "down"]:
+            ak.materialized(corrected_jets[unc][updown])
+
+    def batched():
+        corrected_met = CorrectedMETFactory(met_name_map).build(met, corrected_jets, {})
+        variations = [corrected_met]
+        for unc in ["MET_UnclusteredEnergy"] + uncertainties:
+            variations += [corrected_met[unc]["up"], corrected_met[unc]["down"]]
+        for var in variations:
+            ak.to_numpy(var.pt), ak.to_numpy(var.phi)
+
+    def per_variation():
+        variations = [(corrected_jets, None)]
+        variations += [(corrected_jets, (positive, met.dx, met.dy)) for positive in [True, False]]
+        variations += [(corrected_jets[unc][updown], None) for unc in uncertainties for updown in ["up", "down"]]
+        for variant, deltas in variations:
+            ref = corrected_polar_met(met.pt, met.phi, variant.pt, variant.phi, variant.pt_raw, deltas)
+            ak.to_numpy(ref.pt), ak.to_numpy(ref.phi)
+
+    timings = {
+        "batched": best_time(batched, repeats),
+        "one computation per variation": best_time(per_variation, repeats),
+    }
+    print_timings("MET variations:", timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Timings of the jet and MET corrections")
+    parser.add_argument("-n", "--nevents", type=int, default=100000, help="Number of events")
+    parser.add_argument("-r", "--repeats", type=int, default=3, help="Number of repeats, the shortest time is shown")
+    args = parser.parse_args()
+
+    jets = make_jets(args.nevents)
+    print(f"{args.nevents} events, {len(ak.flatten(jets))} jets")
+    benchmark_clib_jec_levels(jets, args.repeats)
+    benchmark_builds(jets, args.repeats)
+    benchmark_met_variations(jets, args.repeats)
+
+
+if __name__ == "__main__":
+    main()
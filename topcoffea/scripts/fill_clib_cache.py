@@ -0,0 +1,21 @@
+import os
+import sys
+
+from topcoffea.modules.correction_cache import fill_disk_cache
+import topcoffea.modules.disk_cache as disk_cache
+
+# Decompress the POG correctionlib json files into the on-disk cache (e.g. on local scratch), so that workers
+# sharing that area skip the decompression at start up
+# Usage: python fill_clib_cache.py [cache_dir]   (by default, the directory set in TOPCOFFEA_CACHE_DIR is used)
+
+def main():
+    if len(sys.argv) == 2:
+        os.environ[disk_cache.CACHE_DIR_ENV] = sys.argv[1]
+    if not os.environ.get(disk_cache.CACHE_DIR_ENV):
+        print(f"ERROR: Please specify a cache directory, or set {disk_cache.CACHE_DIR_ENV}")
+        return
+    cached = fill_disk_cache()
+    print(f"Cached {len(cached)} correction files in {disk_cache.get_cache_dir('clib')}")
+
+if __name__ == "__main__":
+    main()